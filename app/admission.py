@@ -0,0 +1,195 @@
+from flask import request, session, jsonify, g
+from functools import wraps
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+try:
+    import fcntl # file locks shared by every worker process on the host
+except ImportError: # not available on Windows, limits then apply per process
+    fcntl = None
+
+MAX_RENDER_JOBS = int(os.getenv("MAX_RENDER_JOBS", os.cpu_count() or 1)) # uploads rendering at once on this host
+MAX_SESSION_FILES = int(os.getenv("MAX_SESSION_FILES", 30)) # files one session may have in flight
+DEGRADE_AT = int(os.getenv("DEGRADE_AT", 0)) # running jobs at which new jobs render at DEGRADED_ZOOM, 0 to never degrade
+DEGRADED_ZOOM = float(os.getenv("DEGRADED_ZOOM", 1))
+RETRY_AFTER = int(os.getenv("RETRY_AFTER", 10)) # seconds clients are asked to wait when rejected
+ADMISSION_DIR = os.getenv("ADMISSION_DIR", os.path.join(tempfile.gettempdir(), "form_creator_admission"))
+SESSION_FILES_TTL = int(os.getenv("SESSION_FILES_TTL", 3600)) # seconds after which a session's files in flight are no longer counted
+
+_local_slots = [threading.Lock() for _ in range(MAX_RENDER_JOBS)] # used when fcntl is unavailable
+_local_sessions = {}
+_local_sessions_lock = threading.Lock()
+_last_sweep = 0 # time remove_stale_sessions last ran in this process
+
+def acquire_slot():
+    """
+    Takes a free rendering slot without waiting. Returns the slot and the number of jobs already running, or None if all slots are busy.
+    Slots are tried lowest first, so the busy slots skipped over are the jobs already running.
+    """
+    if fcntl is None:
+        for busy, lock in enumerate(_local_slots):
+            if lock.acquire(blocking=False):
+                return lock, busy
+        return None
+
+    os.makedirs(ADMISSION_DIR, exist_ok=True)
+    for busy in range(MAX_RENDER_JOBS):
+        fd = os.open(os.path.join(ADMISSION_DIR, f"slot-{busy}.lock"), os.O_RDWR | os.O_CREAT)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB) # released by the OS if the worker dies
+            return fd, busy
+        except BlockingIOError:
+            os.close(fd)
+    return None
+
+def release_slot(slot):
+    """
+    Frees a slot returned by acquire_slot.
+    """
+    if fcntl is None:
+        slot.release()
+    else:
+        os.close(slot) # closing the file drops the lock
+
+def _live_reservations(reservations:dict):
+    """
+    Drops reservations whose worker process has died without releasing them, or that are older than SESSION_FILES_TTL.
+    reservations maps a worker's pid to [files, time reserved].
+    """
+    live = {}
+    for pid, (files, reserved) in reservations.items():
+        if time.time() - reserved > SESSION_FILES_TTL:
+            continue
+        try:
+            os.kill(int(pid), 0) # checks the process exists without signalling it
+        except ProcessLookupError:
+            continue
+        except PermissionError: # exists but run by another user
+            pass
+        live[pid] = [files, reserved]
+    return live
+
+def _locked_session_file(path):
+    """
+    Opens and locks a session's count file, making sure it wasn't removed by another worker while waiting for the lock.
+    """
+    while True:
+        file = open(os.open(path, os.O_RDWR | os.O_CREAT), "r+")
+        fcntl.flock(file, fcntl.LOCK_EX) # held only while the count is updated
+        try:
+            if os.fstat(file.fileno()).st_ino == os.stat(path).st_ino:
+                return file
+        except FileNotFoundError:
+            pass
+        file.close() # removed meanwhile, open the new one
+
+def remove_stale_sessions():
+    """
+    Deletes the count files of sessions with no live reservations, left behind by workers that were killed.
+    Runs at most once a minute per process.
+    """
+    global _last_sweep
+    if time.time() - _last_sweep < 60:
+        return
+    _last_sweep = time.time()
+
+    for name in os.listdir(ADMISSION_DIR):
+        path = os.path.join(ADMISSION_DIR, name)
+        try:
+            if not name.startswith("session-") or time.time() - os.path.getmtime(path) < SESSION_FILES_TTL:
+                continue
+            with _locked_session_file(path) as file:
+                reservations = json.loads(file.read() or "{}")
+                if not isinstance(reservations, dict) or not _live_reservations(reservations): # a bare count is from an older version
+                    os.remove(path)
+        except (FileNotFoundError, ValueError): # removed by another worker, or written by an older version
+            continue
+
+def reserve_session_files(session_id, count):
+    """
+    Adds count to the files in flight for a session. Returns False, without reserving, if that would exceed MAX_SESSION_FILES.
+    A negative count releases files. Reservations are recorded per worker process, so those of a killed worker expire.
+    """
+    if fcntl is None:
+        with _local_sessions_lock:
+            total = _local_sessions.get(session_id, 0) + count
+            if count > 0 and total > MAX_SESSION_FILES:
+                return False
+            if total > 0:
+                _local_sessions[session_id] = total
+            else:
+                _local_sessions.pop(session_id, None)
+        return True
+
+    os.makedirs(ADMISSION_DIR, exist_ok=True)
+    if count > 0:
+        remove_stale_sessions()
+
+    path = os.path.join(ADMISSION_DIR, f"session-{session_id}.json")
+    with _locked_session_file(path) as file:
+        try:
+            reservations = _live_reservations(json.loads(file.read() or "{}"))
+        except ValueError: # partly written by a worker killed mid-update
+            reservations = {}
+
+        pid = str(os.getpid())
+        files = reservations.get(pid, [0])[0] + count
+        if count > 0 and sum(entry[0] for entry in reservations.values()) + count > MAX_SESSION_FILES:
+            if not reservations:
+                os.remove(path) # created by this call, or held only expired reservations
+            return False
+
+        if files > 0:
+            reservations[pid] = [files, time.time()]
+        else:
+            reservations.pop(pid, None)
+
+        if reservations:
+            file.seek(0)
+            file.truncate()
+            file.write(json.dumps(reservations))
+        else:
+            os.remove(path) # nothing in flight, workers waiting on the lock will open a new file
+    return True
+
+def rejected(message, status, retry=True):
+    """
+    Response for a rejected upload, in the same error format as validation errors so the upload page shows it.
+    Clients are asked to retry after RETRY_AFTER seconds, unless retry is False because the upload can never be accepted.
+    """
+    return jsonify({"errors": {"Upload": [message]}}), status, {"Retry-After": str(RETRY_AFTER)} if retry else {}
+
+def admission_controlled(f):
+    """
+    Limits rendering jobs across the host and files in flight per session, rejecting excess uploads straight away
+    with 503 or 429 and a Retry-After header instead of queueing them on a worker, or with 413 if an upload has more
+    files than a session may ever have in flight. Sets g.render_zoom, which is
+    lowered to DEGRADED_ZOOM when DEGRADE_AT jobs are already running.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        slot = acquire_slot() # checked before the upload body is parsed
+        if slot is None:
+            return rejected(f"The server is busy generating other documents. Please try again in {RETRY_AFTER} seconds.", 503)
+        slot, busy = slot
+
+        try:
+            session_id = session.setdefault("id", uuid.uuid4().hex)
+            count = len(request.files.getlist("files[]"))
+            if count > MAX_SESSION_FILES: # too many for any session, waiting won't help
+                return rejected(f"Please upload at most {MAX_SESSION_FILES} files at once.", 413, retry=False)
+            if not reserve_session_files(session_id, count):
+                return rejected("You already have files being processed. Please wait for them to finish.", 429)
+
+            try:
+                g.render_zoom = DEGRADED_ZOOM if DEGRADE_AT and busy >= DEGRADE_AT else 2
+                return f(*args, **kwargs)
+            finally:
+                reserve_session_files(session_id, -count)
+        finally:
+            release_slot(slot)
+    return decorated_function
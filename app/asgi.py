@@ -0,0 +1,195 @@
+import asyncio
+import io
+import json
+import logging
+import mimetypes
+import os
+import re
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+from flask import request, session
+
+import offload
+import sandbox
+from batches import EVENT_STREAM_SECONDS, batch_path, events_after, read_events
+from main import app as flask_app, FORM_FILES, TEMPLATE_PATH
+from warmup import startup_report, warm_up
+
+CHUNK_SIZE = 64 * 1024 # bytes read and sent at a time when streaming files
+EVENT_POLL_SECONDS = 0.5 # how often an event stream checks its batch for new events
+KEEP_ALIVE_SECONDS = 15 # longest an event stream stays quiet, so proxies don't close it
+
+# asgiref decorates run_wsgi_app with the thread sensitive sync_to_async. The undecorated method is reached through
+# __wrapped__, which relies on asgiref internals as of the version pinned in requirements.txt, so check it on upgrades.
+_run_wsgi_app = getattr(WsgiToAsgiInstance.__dict__.get("run_wsgi_app"), "__wrapped__", None)
+if _run_wsgi_app is None:
+    raise ImportError("asgiref's WsgiToAsgiInstance.run_wsgi_app has changed, update ThreadedWsgiToAsgiInstance for this version")
+
+class ThreadedWsgiToAsgiInstance(WsgiToAsgiInstance):
+    """
+    Runs the Flask app for one request in a thread from the event loop's pool. asgiref's default runs every request on a single shared thread.
+    """
+
+    async def run_wsgi_app(self, body):
+        await sync_to_async(_run_wsgi_app, thread_sensitive=False)(self, body)
+
+    def build_environ(self, scope, body):
+        environ = super().build_environ(scope, body)
+        environ["form_creator.event_stream"] = True # tells /batch that progress can be streamed, see event_stream
+        return environ
+
+class ThreadedWsgiToAsgi(WsgiToAsgi):
+    """
+    WsgiToAsgi using ThreadedWsgiToAsgiInstance. The request body is still received on the event loop before the app is called,
+    so slow uploads wait there instead of holding a thread.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await ThreadedWsgiToAsgiInstance(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+wsgi_app = ThreadedWsgiToAsgi(flask_app)
+
+async def stream_file(send, path:str):
+    """
+    Sends a file as a download in chunks, reading it in the default executor so the event loop is never blocked on disk.
+    """
+    loop = asyncio.get_running_loop()
+    mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", mimetype.encode()),
+            (b"content-length", str(os.path.getsize(path)).encode()),
+            (b"content-disposition", f"attachment; filename={os.path.basename(path)}".encode()),
+        ],
+    })
+
+    with open(path, "rb") as file:
+        while True:
+            chunk = await loop.run_in_executor(None, file.read, CHUNK_SIZE)
+            more = len(chunk) == CHUNK_SIZE
+            await send({"type": "http.response.body", "body": chunk, "more_body": more})
+            if not more:
+                break
+
+def static_download(scope):
+    """
+    Returns the file path for a template or blank form download, or None if the request should go to the Flask app.
+    """
+    if scope["method"] != "GET":
+        return None
+
+    path = scope["path"]
+    if path == "/download-template":
+        return TEMPLATE_PATH
+    if path.startswith("/download-form/") and path[len("/download-form/"):] in FORM_FILES:
+        return os.path.join("forms", FORM_FILES[path[len("/download-form/"):]])
+    return None # unknown forms get the Flask app's 404
+
+def event_stream(scope):
+    """
+    Returns the batch directory and the number of events the client already has for a progress stream request from a
+    logged in session that owns the batch, or None if the request should go to the Flask app, which answers with JSON or an error.
+    """
+    headers = dict(scope["headers"])
+    if b"text/event-stream" not in headers.get(b"accept", b""):
+        return None
+
+    instance = ThreadedWsgiToAsgiInstance(flask_app)
+    instance.scope = scope # normally set when the instance is called
+    environ = instance.build_environ(scope, io.BytesIO())
+    with flask_app.request_context(environ): # opens the Flask session from the cookie
+        if not session.get("logged_in"):
+            return None
+        path = batch_path(scope["path"].split("/")[2], session.get("id", ""))
+        after = events_after(request.headers.get("Last-Event-ID") or request.args.get("after"))
+    return (path, after) if path else None
+
+async def wait_for_disconnect(receive):
+    """
+    Returns once the client has closed the connection.
+    """
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+async def stream_events(receive, send, path:str, after:int):
+    """
+    Sends a batch's progress events after the first after as Server-Sent Events, until the batch is zipped, the client
+    goes away or EVENT_STREAM_SECONDS pass, when the browser reconnects from the last event ID. The stream only waits
+    on the event loop, so open streams don't hold threads other requests need.
+    """
+    loop = asyncio.get_running_loop()
+
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", b"text/event-stream; charset=utf-8"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"), # stops nginx buffering the stream
+        ],
+    })
+
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    sent = after
+    started = last_sent = loop.time()
+    try:
+        while not disconnected.done() and loop.time() - started < EVENT_STREAM_SECONDS:
+            for event in await loop.run_in_executor(None, read_events, path, sent):
+                sent += 1
+                last_sent = loop.time()
+                await send({"type": "http.response.body", "body": f"id: {sent}\ndata: {json.dumps(event)}\n\n".encode(), "more_body": True})
+                if event["stage"] == "zipped":
+                    return
+            if loop.time() - last_sent > KEEP_ALIVE_SECONDS:
+                last_sent = loop.time()
+                await send({"type": "http.response.body", "body": b": keep-alive\n\n", "more_body": True})
+            await asyncio.wait([disconnected], timeout=EVENT_POLL_SECONDS) # wakes early if the client goes away
+    finally:
+        disconnected.cancel()
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+async def lifespan(receive, send):
+    """
+    Warms the app's caches and starts the workbook sandbox and the process pool for read_excel and produce_output with the
+    server, and stops the pool on shutdown. The startup times are logged with uvicorn's own messages.
+    """
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            timings = await asyncio.get_running_loop().run_in_executor(None, warm_up)
+            startup_report(timings, logging.getLogger("uvicorn.error"))
+            await asyncio.get_running_loop().run_in_executor(None, sandbox.start) # warms up in the background, as under gunicorn
+            offload.start()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await asyncio.get_running_loop().run_in_executor(None, offload.shutdown)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def app(scope, receive, send):
+    """
+    ASGI entry point. Template and blank form downloads and batch progress streams are served directly on the event loop,
+    every other route by the Flask app.
+    """
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+
+    path = static_download(scope) if scope["type"] == "http" else None
+    if path is not None:
+        await stream_file(send, path)
+        return
+
+    if scope["type"] == "http" and scope["method"] == "GET" and re.fullmatch(r"/batch/[0-9a-f]{32}/events", scope["path"]):
+        # the session and batch are checked in a thread, as they read files
+        stream = await asyncio.get_running_loop().run_in_executor(None, event_stream, scope)
+        if stream is not None:
+            await stream_events(receive, send, *stream)
+            return
+
+    await wsgi_app(scope, receive, send)
@@ -0,0 +1,147 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+
+BATCH_DIR = os.getenv("BATCH_DIR", os.path.join(tempfile.gettempdir(), "form_creator_batches")) # shared by every worker on the host
+BATCH_TTL = int(os.getenv("BATCH_TTL", 3600)) # seconds a batch and its results are kept after it was last used
+EVENT_STREAM_SECONDS = int(os.getenv("EVENT_STREAM_SECONDS", 300)) # longest a progress stream is held open before the browser reconnects
+
+def write_atomic(path:str, data:bytes):
+    """
+    Writes data to path through a temporary file, so other workers never see a partly written file.
+    """
+    directory = os.path.dirname(path)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+def remove_expired():
+    """
+    Deletes batches not used for BATCH_TTL seconds.
+    """
+    if not os.path.isdir(BATCH_DIR):
+        return
+    for name in os.listdir(BATCH_DIR):
+        path = os.path.join(BATCH_DIR, name)
+        try:
+            if time.time() - os.path.getmtime(path) > BATCH_TTL:
+                shutil.rmtree(path, ignore_errors=True)
+        except FileNotFoundError: # removed by another worker
+            continue
+
+def create_batch(owner:str):
+    """
+    Creates an empty batch belonging to the session owner and returns its ID.
+    """
+    remove_expired()
+
+    batch_id = uuid.uuid4().hex
+    os.makedirs(BATCH_DIR, mode=0o700, exist_ok=True)
+    os.chmod(BATCH_DIR, 0o700) # only the app's user can list batches, also when created by an earlier version
+    path = os.path.join(BATCH_DIR, batch_id)
+    os.makedirs(path, mode=0o700)
+    os.chmod(path, 0o700) # regardless of umask
+    write_atomic(os.path.join(path, "owner"), owner.encode())
+    return batch_id
+
+def batch_path(batch_id:str, owner:str):
+    """
+    Returns the directory of a batch, or None if it doesn't exist or belongs to another session.
+    """
+    if not re.fullmatch(r"[0-9a-f]{32}", batch_id):
+        return None
+
+    path = os.path.join(BATCH_DIR, batch_id)
+    try:
+        with open(os.path.join(path, "owner")) as file:
+            if file.read() != owner:
+                return None
+    except FileNotFoundError:
+        return None
+
+    os.utime(path) # keep batches in use from expiring
+    return path
+
+def save_result(path:str, name:str, pdf_path:str):
+    """
+    Moves the PDF generated for the file name into place in a batch, replacing any earlier attempt. pdf_path must be in the
+    batch's directory, so the move is atomic.
+    """
+    os.replace(pdf_path, os.path.join(path, f"{name}.pdf"))
+    try:
+        os.remove(os.path.join(path, f"{name}.errors.json"))
+    except FileNotFoundError:
+        pass
+
+def save_errors(path:str, name:str, errors:list):
+    """
+    Stores the errors found in the file name in a batch, replacing any earlier attempt.
+    """
+    write_atomic(os.path.join(path, f"{name}.errors.json"), json.dumps(errors).encode())
+    try:
+        os.remove(os.path.join(path, f"{name}.pdf"))
+    except FileNotFoundError:
+        pass
+
+def result_path(path:str, name:str):
+    """
+    Returns the path of the PDF generated for the file name in a batch, or None if there isn't one.
+    """
+    result = os.path.join(path, f"{name}.pdf")
+    return result if os.path.exists(result) else None
+
+def load_errors(path:str, name:str):
+    """
+    Returns the errors stored for the file name in a batch, or None if there are none.
+    """
+    try:
+        with open(os.path.join(path, f"{name}.errors.json")) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+def record_event(path:str, file, stage:str, form=None, seconds=None):
+    """
+    Appends a progress event to a batch's event log. Called by workers and by workbook sandbox processes, so it only ever appends.
+    """
+    event = {"time": time.time(), "file": file, "stage": stage}
+    if form is not None:
+        event["form"] = form
+    if seconds is not None:
+        event["seconds"] = round(seconds, 3)
+
+    fd = os.open(os.path.join(path, "events.jsonl"), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+    try:
+        os.write(fd, (json.dumps(event) + "\n").encode()) # one small append, not interleaved with other processes' events
+    finally:
+        os.close(fd)
+
+def events_after(value):
+    """
+    Returns the number of events a client already has, from its Last-Event-ID header or ?after= value.
+    Anything that isn't a count gives 0, so the client gets every event again.
+    """
+    try:
+        return max(int(value or 0), 0)
+    except ValueError:
+        return 0
+
+def read_events(path:str, after:int=0):
+    """
+    Returns the events of a batch after the first after events.
+    """
+    try:
+        with open(os.path.join(path, "events.jsonl")) as file:
+            lines = file.readlines()
+    except FileNotFoundError:
+        return []
+    return [json.loads(line) for line in lines[max(after, 0):] if line.endswith("\n")] # skip an event still being written
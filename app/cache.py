@@ -0,0 +1,167 @@
+from collections import OrderedDict
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl # file locks shared by every worker process on the host
+except ImportError: # not available on Windows, eviction is then only serialised within a process
+    fcntl = None
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "disk") # "disk" to share caches between workers on the host, "memory" for one per process
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(tempfile.gettempdir(), "form_creator_cache"))
+CACHE_TTL = int(os.getenv("CACHE_TTL", 3600)) # seconds a disk cache entry is kept after it was last used, entries hold patient data
+STALE_TEMP_SECONDS = 3600 # age after which a temporary file left by a killed worker is removed
+
+
+class MemoryCache:
+    """
+    Size-bounded least-recently-used cache of bytes values, keyed by string. Entries are evicted oldest first once max_bytes is exceeded.
+    Every cache backend has the same get and set methods, so callers don't depend on where entries are kept.
+    """
+
+    def __init__(self, max_bytes:int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict() # key -> bytes, oldest first
+        self._size = 0 # total bytes currently held
+        self._lock = threading.Lock() # shared between request threads
+
+    def get(self, key:str):
+        """
+        Returns the cached value for key, or None if it is not cached.
+        """
+
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key) # mark as recently used
+            return value
+
+    def set(self, key:str, value:bytes):
+        """
+        Stores value under key and evicts the least recently used entries until the cache fits in max_bytes.
+        """
+
+        if len(value) > self.max_bytes: # would evict everything else and still not fit
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._size -= len(self._entries.pop(key))
+            self._entries[key] = value
+            self._size += len(value)
+
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+class DiskCache:
+    """
+    Size-bounded least-recently-used cache of bytes values kept as files in a directory, so every worker process on the host
+    shares it. Entries are written atomically and evicted oldest used first, under a file lock, once max_bytes is exceeded.
+    Entries not used for ttl seconds expire. The directory is only accessible to the user running the app.
+    """
+
+    def __init__(self, directory:str, max_bytes:int, ttl:int=CACHE_TTL):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock() # serialises eviction between threads, the file lock between processes
+        self._last_sweep = 0 # time expired entries were last removed by get
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        os.chmod(directory, 0o700) # also when created by an earlier version without the restriction
+
+    def _path(self, key:str):
+        """
+        Returns the file holding the value for key. Keys are hashed so any string is a safe file name.
+        """
+
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest())
+
+    def get(self, key:str):
+        """
+        Returns the cached value for key, or None if it is not cached.
+        """
+
+        if time.time() - self._last_sweep > 60: # expired entries go even while nothing new is cached
+            self._last_sweep = time.time()
+            self._evict()
+
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return None # expired, removed by the next eviction
+            with open(path, "rb") as file: # still readable if another worker evicts it meanwhile
+                value = file.read()
+            os.utime(path) # mark as recently used
+        except FileNotFoundError:
+            return None
+        return value
+
+    def set(self, key:str, value:bytes):
+        """
+        Stores value under key and evicts the least recently used entries until the cache fits in max_bytes.
+        """
+
+        if len(value) > self.max_bytes: # would evict everything else and still not fit
+            return
+
+        # write to a temporary file and rename, so other workers never read a partly written entry
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(value)
+            os.replace(temp_path, self._path(key))
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+        self._evict()
+
+    def _evict(self):
+        """
+        Removes expired entries, then the least recently used until the cache fits in max_bytes, holding the cache's lock file meanwhile.
+        """
+
+        with self._lock, open(os.path.join(self.directory, ".lock"), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX) # released by the OS if the worker dies
+
+            entries = [] # (last used, size, path)
+            for name in os.listdir(self.directory):
+                if name == ".lock":
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                    if time.time() - stat.st_mtime > (STALE_TEMP_SECONDS if name.startswith(".tmp-") else self.ttl):
+                        os.remove(path)
+                        continue
+                except FileNotFoundError: # replaced or removed by another worker
+                    continue
+                if not name.startswith("."): # temporary files still being written
+                    entries.append((stat.st_mtime, stat.st_size, path))
+
+            size = sum(entry[1] for entry in entries)
+            for _, entry_size, path in sorted(entries):
+                if size <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                size -= entry_size
+
+def open_cache(name:str, max_bytes:int):
+    """
+    Returns the cache called name from the backend chosen by CACHE_BACKEND. Disk caches with the same name are shared by every
+    worker using the same CACHE_DIR.
+    """
+    if CACHE_BACKEND == "memory":
+        return MemoryCache(max_bytes)
+    if CACHE_BACKEND == "disk":
+        os.makedirs(CACHE_DIR, mode=0o700, exist_ok=True) # only the app's user can list the caches
+        return DiskCache(os.path.join(CACHE_DIR, name), max_bytes)
+    raise ValueError(f"Unknown CACHE_BACKEND {CACHE_BACKEND!r}, expected 'disk' or 'memory'")
@@ -0,0 +1,39 @@
+import os
+import time
+
+import sandbox
+from admission import MAX_RENDER_JOBS
+from warmup import STARTUP_BUDGET, startup_report, warm_up
+
+started = time.perf_counter() # this file is read before the app is loaded
+
+preload_app = True # import the app and warm its caches once in the master, workers are forked ready to serve
+
+# one more worker than can render at once, so pages, login and rejections are still served while every render slot is busy
+workers = int(os.getenv("WEB_CONCURRENCY", MAX_RENDER_JOBS + 1))
+
+# workers must outlive a workbook's time limit, so a stuck workbook is stopped and reported by the sandbox rather than
+# the worker being killed with the whole request; 0 disables the worker timeout when workbooks have no limit
+timeout = int(sandbox.WORKBOOK_TIMEOUT) + 30 if sandbox.WORKBOOK_TIMEOUT else 0
+
+def when_ready(server):
+    """
+    Warms the preloaded app's caches before any worker is forked and reports the startup time.
+    """
+    timings = {"load app": time.perf_counter() - started}
+    timings.update(warm_up())
+    startup_report(timings, server.log)
+
+def pre_fork(server, worker):
+    worker.fork_started = time.perf_counter() # copied into the worker by the fork
+
+def post_worker_init(worker):
+    """
+    Starts the worker's sandbox and reports how long the worker took from fork to accepting requests.
+    """
+    sandbox.start() # each worker needs its own forkserver, started now so it is warm by the first upload
+    ready = time.perf_counter() - worker.fork_started
+    if ready > STARTUP_BUDGET:
+        worker.log.warning("Worker %s ready in %.3fs, over the %gs budget", worker.pid, ready, STARTUP_BUDGET)
+    else:
+        worker.log.info("Worker %s ready in %.3fs", worker.pid, ready)
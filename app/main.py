@@ -1,19 +1,95 @@
+import csv
 import io
 from datetime import datetime
+from functools import lru_cache, partial
+import hashlib
 import math
+import os
+import shutil
+import tempfile
+import time
+import uuid
 import zipfile
 
 import pandas as pd
 import fitz
-from flask import Flask, request, send_file, render_template, jsonify, send_from_directory, session
+from flask import Flask, request, send_file, render_template, jsonify, send_from_directory, session, g
 from werkzeug.utils import secure_filename
+from admission import MAX_RENDER_JOBS, MAX_SESSION_FILES, admission_controlled
 from auth import auth, login_required
+from batches import (batch_path, create_batch, events_after, load_errors, read_events, record_event, result_path,
+                     save_errors, save_result)
+from cache import open_cache
+from profiling import profiling, profiled
+from sandbox import SandboxError, run_sandboxed, run_sandboxed_each, workbook_deadline
+from scores import (compute_scores, score_WHODAS, score_WHODASKIDS, score_CANS, score_LSP, score_LAWTON, score_BBS,
+                    score_LEFS, score_FRAT, score_HONOS, score_CASP, score_HONOSCA)
+from workload import capture_enabled, capture_file, record_upload
 from dotenv import load_dotenv
 load_dotenv()
 
 app = Flask(__name__)
 app.secret_key = "your_secret_key"
 app.register_blueprint(auth)
+app.register_blueprint(profiling)
+
+PREVIEW_DPI = int(os.getenv("PREVIEW_DPI", 40)) # resolution of preview thumbnails
+PREVIEW_CACHE_BYTES = int(os.getenv("PREVIEW_CACHE_MB", 64)) * 1024 * 1024 # space allowed for each preview cache
+OUTPUT_CACHE_BYTES = int(os.getenv("OUTPUT_CACHE_MB", 1024)) * 1024 * 1024 # space allowed for generated PDFs
+
+preview_workbooks = open_cache("preview_workbooks", PREVIEW_CACHE_BYTES) # uploaded workbooks awaiting preview, keyed by content hash
+preview_images = open_cache("preview_images", PREVIEW_CACHE_BYTES) # filled forms and rendered thumbnails, keyed by content hash
+rendered_outputs = open_cache("rendered_outputs", OUTPUT_CACHE_BYTES) # generated PDFs, keyed by output_key
+
+TEMPLATE_PATH = '../template.xlsx'  # Path to the Excel template
+
+# Map form names in download links to actual file paths in forms/
+FORM_FILES = {
+    'whodas': 'WHODAS.pdf',
+    'whodas-youth': 'WHODASKIDS.pdf',
+    'cans': 'CANS.pdf',
+    'lsp': 'LSP.pdf',
+    'lawton-brody-iadl': 'LAWTON.pdf',
+    'lefs': 'LEFS.pdf',
+    'berg-balance-scale': 'BBS.pdf',
+    'frat': 'FRAT.pdf',
+    'honos': 'HONOS.pdf',
+    'casp': 'CASP.pdf',
+    'honosca':'HONOSCA.pdf'
+}
+
+def output_version():
+    """
+    Returns a hash of the templates and option files in forms/ and of the code filling and scoring them, so documents
+    cached by an earlier deploy aren't served once any of them change.
+    """
+    
+    paths = sorted(os.path.join('forms', name) for name in os.listdir('forms'))
+    paths += [__file__, os.path.join(os.path.dirname(__file__), 'scores.py')]
+    
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()[:16]
+
+OUTPUT_VERSION = output_version() # part of every cached document's key
+
+text_locations = {} # search results on the blank templates, keyed by template file, page number, string and case sensitivity
+
+# text highlighted on the HONOS form for each problem ticked in question 8
+HONOS_PROBLEMS = {
+    'A': ['A phobic', 'A,'],
+    'B': ['B anxiety', 'B,'],
+    'C': ['C obsessive-compulsive', 'C,'],
+    'D': ['D stress', 'D,'],
+    'E': ['E dissociative', 'E,'],
+    'F': ['F somatoform', 'F,'],
+    'G': ['G eating', 'G,'],
+    'H': ['H sleep', 'H,'],
+    'I': ['I sexual', 'I,'],
+    'J': ['J other', 'J)']
+}
 
 
 def validate_columns(master, file):
@@ -61,9 +137,9 @@ def validate_columns(master, file):
     
     return error_messages
 
-def render_to_image(filled_form):
+def render_to_image(filled_form, zoom=2):
     """
-    Renders the filled PDF form to images and saves them as new PDFs.
+    Renders the filled PDF form to images and saves them as new PDFs. zoom scales the raster resolution from 72 dpi.
     """
     
     temp_pdf = fitz.open()  # Create a new PDF 
@@ -74,16 +150,27 @@ def render_to_image(filled_form):
         page = filled_form[page_number]
         
         # Render page to an image
-        pix = page.get_pixmap(matrix=fitz.Matrix(2,2))  # Zoom for better quality
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom,zoom))  # Zoom for better quality
+        size = (page.rect * fitz.Matrix(2,2)).irect  # page size is kept the same whatever the zoom
         
         img_pdf = fitz.open()  # New PDF for this page
-        img_page = img_pdf.new_page(width=pix.width, height=pix.height)  # Create a new page
+        img_page = img_pdf.new_page(width=size.width, height=size.height)  # Create a new page
         img_page.insert_image(img_page.rect, stream=pix.tobytes())  # Insert image into the new page
         
         temp_pdf.insert_pdf(img_pdf)  # Insert the image PDF into the temp PDF
 
     return temp_pdf
 
+def render_thumbnail(filled_form, page_number:int, dpi:int=PREVIEW_DPI):
+    """
+    Renders a single page of the filled PDF form to a low resolution PNG and returns the image bytes.
+    """
+    
+    page = filled_form[page_number]
+    pix = page.get_pixmap(dpi=dpi) # low dpi keeps previews small and fast
+    
+    return pix.tobytes("png")
+
 def read_excel(excel):
     """
     Reads in path to excel file and populates relevant dictionaries with values.
@@ -169,6 +256,52 @@ def highlight_box(x0, y0, x1, y1, page):
     
     return page
     
+@lru_cache(maxsize=None)
+def read_lines(path:str):
+    """
+    Returns the lines of a text file in forms/. Files are only read once per process.
+    """
+    
+    with open(path, 'r') as file:
+        return tuple(file.readlines())
+
+@lru_cache(maxsize=None)
+def template_page_count(form_name:str):
+    """
+    Returns the number of pages of a blank template in forms/. Templates are only opened once per process.
+    """
+    
+    with fitz.open(f'forms/{form_name}.pdf') as template:
+        return template.page_count
+
+def find_text(page, string:str, case_sensitive=True):
+    """
+    Returns the areas of page where string appears. Templates opened from forms/ never change their text, 
+    so results are cached in text_locations and later searches of the same template page are free.
+    """
+    
+    key = (page.parent.name, page.number, string, case_sensitive)
+    if key in text_locations:
+        return text_locations[key]
+    
+    text_instances = page.search_for(string) # find all instances of string on page
+
+
+    if case_sensitive == True: # filter if case-sensitive
+            
+        final_instances = [] # stores filtered instances
+            
+        for inst in text_instances:                
+            if string in page.get_text("text", clip=inst): # compare string to instances
+                final_instances.append(inst)
+    else:
+        final_instances = text_instances # not case-sensitive search by default with fitz
+    
+    if page.parent.name: # documents opened from memory have no file name to key by
+        text_locations[key] = final_instances
+    
+    return final_instances
+
 def highlight_text(string:str, template, ins_no=0, case_sensitive=True):
     """
     Highlights the text on template defined by string. By default, case senstive search and can optionally add a number for which instance to highlight. 
@@ -177,18 +310,7 @@ def highlight_text(string:str, template, ins_no=0, case_sensitive=True):
     for page_num in range(template.page_count): # search each page
         page = template.load_page(page_num) # load page
         
-        text_instances = page.search_for(string) # find all instances of string on page
-    
-    
-        if case_sensitive == True: # filter if case-sensitive
-                
-            final_instances = [] # stores filtered instances
-                
-            for inst in text_instances:                
-                if string in page.get_text("text", clip=inst): # compare string to instances
-                    final_instances.append(inst)
-        else:
-            final_instances = text_instances # not case-sensitive search by default with fitz
+        final_instances = find_text(page, string, case_sensitive) # find all instances of string on page
         
         
         # add highlight and update for each string
@@ -208,43 +330,12 @@ def fill_WHODAS(general_values:dict, form_values:dict):
     
     template = fitz.open('forms/WHODAS.pdf')
             
-    # calculate extra fields
-    for i in range(1,7): 
-        if i != 5: # 5 is an edge case
-            
-            number_params = sum(1 for key, _ in form_values.items() if key.startswith('D' + str(i)))
-            total = sum(value for key, value in form_values.items() if key.startswith('D' + str(i)))
-            
-            form_values[str(i) + '_overall'] = total
-            form_values[str(i) + '_avg'] = round(total/number_params , 1)
-            form_values[str(i) + '_percent'] = str(round((total/(number_params * 5)) * 100 , 1)) + "%"
-    
-    # calculate values for section 5 part 1        
-    form_values['5_overall'] = form_values['D51'] + form_values['D52'] + form_values['D53'] + form_values['D54']
-    form_values['5_avg'] = round(form_values['5_overall'] / 4, 1)
-    form_values['5_percent'] = str(round((form_values['5_overall'] / 20) * 100, 1)) + '%'
-    
-    # calculate values for section 5 part 2
-    form_values['5_overall2'] = form_values['D55'] + form_values['D56'] + form_values['D57'] + form_values['D58']
-    form_values['5_avg2'] = round(form_values['5_overall2'] / 4, 1)
-    form_values['5_percent2'] = str(round((form_values['5_overall2'] / 20) * 100, 1)) + '%'
+    form_values = score_WHODAS(form_values) # calculate extra fields
     
     # if part 2 of 5 is N/A and left empty
-    if math.isnan(form_values['5_overall2']):
-        form_values['D55'], form_values['D56'], form_values['D57'], form_values['D58'], form_values['5_avg2'], form_values['5_overall2'], form_values['5_percent2']  = "N/A", "N/A", "N/A", "N/A", "N/A", "N/A", "" # will appear on document as N/A
-        
+    if form_values['5_overall2'] == 'N/A':
         page = template.load_page(1)
         page.draw_line((26, 363), (583.7, 209.3), width=2) # cross out section
-        
-        # find total values, counting an extra 20 for part 2
-        form_values['total'] = form_values['1_overall'] + form_values['2_overall'] + form_values['3_overall'] + form_values['4_overall'] + form_values['5_overall'] + form_values['6_overall'] + 20
-    
-    else: # total values is equal to all sections combined
-        form_values['total'] = form_values['1_overall'] + form_values['2_overall'] + form_values['3_overall'] + form_values['4_overall'] + form_values['5_overall'] + form_values['5_overall2'] + form_values['6_overall']
-    
-    # calculate final extra values using total
-    form_values['avg'] = round(form_values['total'] / 36, 1)
-    form_values['percent'] = 'Total Score: ' + str(round((form_values['total'] / 180) * 100, 1)) + '%'
     
     # Fill in textboxes with values generated
     template = fill_textboxes(general_values, form_values, template)
@@ -282,55 +373,14 @@ def fill_WHODASKIDS(general_values:dict, form_values:dict):
     
     template = fitz.open('forms/WHODASKIDS.pdf') # read in template pdf
     
-    # calculate extra fields
-    for i in range(1,7): 
-        if i != 5: # section 5 is edge case
-            number_params = sum(1 for key, _ in form_values.items() if isinstance(key, int) and key // 10 == i) # number of keys in section
-            total = sum(value for key, value in form_values.items() if isinstance(key, int) and key // 10 == i)
-            
-            form_values[str(i) + '_total'] = total
-            form_values[str(i) + '_avg'] = round((total / (number_params * 5) * 100) , 1) # calculate percentage
-
-    
-    # calcualte for section 5
-    form_values['5_total'] = form_values[51] + form_values[52] + form_values[53] + form_values[54]
-    form_values['5_total2'] = form_values[55] + form_values[56] + form_values[57] + form_values[58] + form_values[59]
+    form_values = score_WHODASKIDS(form_values) # calculate extra fields
     
     # if section 2 of 5 is N/A and left empty
-    if math.isnan(form_values['5_total2']):
-        form_values[55], form_values[56], form_values[57], form_values[58], form_values[59], form_values['5_total2'], form_values['5_avg2'] = "N/A", "N/A", "N/A", "N/A", "N/A", "N/A", "N/A"
-        
+    if form_values['5_total2'] == 'N/A':
         # cross out empty section
         page = template.load_page(1)
         page.draw_line((36.5,476.2), (505, 337), width=2)
         
-        # calculate document total without part 2 of section 5
-        total = form_values['1_total'] + form_values['2_total'] + form_values['3_total'] + form_values['4_total'] + form_values['5_total'] + form_values['6_total'] + 25
-    else:
-        # calculate document total with part 2 of section 5
-        total = form_values['1_total'] + form_values['2_total'] + form_values['3_total'] + form_values['4_total'] + form_values['5_total'] + form_values['5_total2'] + form_values['6_total'] 
-        form_values['5_avg2'] = round((form_values['5_total2'] / 25) * 100, 1)
-    
-    form_values['5_avg'] = round((form_values['5_total'] / 20) * 100, 1)
-    
-    # find total values    
-    form_values['percentage'] = "Score: " + str(round(total / 34, 2)) + "/5 = " + str(round(total/1.7, 1)) + "%"
-    form_values['total'] = "Total: " + str(total) + "/170"
-    
-    # add in strings for presentation on document
-    for i in range(1,7): 
-        if i != 5:
-            number_params = sum(1 for key, _ in form_values.items() if isinstance(key, int) and key // 10 == i) # number of keys in section
-            form_values[str(i) + '_total'] = str(form_values[str(i) + '_total']) + "/" + str(number_params * 5)
-            form_values[str(i) + '_avg'] = str(form_values[str(i) + '_avg']) + "%"
-    
-    # make strings for section 5
-    form_values['5_total'] = str(form_values['5_total']) + "/20"
-    form_values['5_avg'] = str(form_values['5_avg']) + "%"
-    if form_values['5_total2'] != 'N/A':
-        form_values['5_total2'] = str(form_values['5_total2']) + "/25"
-        form_values['5_avg2'] = str(form_values['5_avg2']) + "%"
-        
     template = fill_textboxes(general_values, form_values, template)
     
     return template
@@ -342,13 +392,9 @@ def fill_CANS(general_values:dict, form_values:dict):
     
     template = fitz.open('forms/CANS.pdf') # read in template pdf
 
-    # add in totals to dictionary
-    form_values['A_subtotal'] = 0
-    form_values['B_subtotal'] = 0
-    form_values['C_subtotal'] = 0
-    form_values['D_subtotal'] = 0
+    form_values = score_CANS(form_values) # add in totals and CANS level to dictionary
 
-    # tick the relevant checkboxes on the page and add to totals
+    # tick the relevant checkboxes on the page
     for page in template: # gather fields
         for field in page.widgets():
             # Check if it's a checkbox
@@ -359,23 +405,9 @@ def fill_CANS(general_values:dict, form_values:dict):
                 
                 if form_values[question_no].upper() == 'Y' and key[:1] == 'Y':
                     field.field_value = True  # Set checkbox to checked
-                    
-                    # add to totals
-                    if question_no > 0 and question_no < 11:
-                        form_values['A_subtotal'] += 1
-                    elif question_no > 10 and question_no < 15:
-                        form_values['B_subtotal'] += 1
-                    elif question_no > 14 and question_no < 26:
-                        form_values['C_subtotal'] += 1
-                    elif question_no > 25 and question_no < 29:
-                        form_values['D_subtotal'] += 1                    
-                          
                 elif form_values[question_no].upper() == 'N' and key[:1] == 'N':
                     field.field_value = True  # Set checkbox to checked
                 field.update()
-    
-    # calculate total 
-    form_values['subtotal'] = form_values['A_subtotal'] + form_values['B_subtotal'] + form_values['C_subtotal'] + form_values['D_subtotal']
 
     # define coordinates for highlighting descriptions on right side of page
     x_desc = [638.5,815.8] 
@@ -383,38 +415,10 @@ def fill_CANS(general_values:dict, form_values:dict):
     
     page = template.load_page(0) # higlights on page 1
     
-    # calculate CANS level
-    if form_values['A_subtotal'] < 4:
-        if form_values['B_subtotal'] >= 4:
-            form_values['total'] = 4.2
-            page = highlight_box(x_desc[0], y_desc[3], x_desc[1], y_desc[4], page)
-        elif form_values['C_subtotal'] >= 4: # check C subtotal
-            form_values['total'] = 4.1
-            page = highlight_box(x_desc[0], y_desc[3], x_desc[1], y_desc[4], page)
-        elif form_values['C_subtotal'] == 3 or form_values['D_subtotal'] == 3:
-            form_values['total'] = 3
-            page = highlight_box(x_desc[0], y_desc[4], x_desc[1], y_desc[5], page)
-        elif form_values['C_subtotal'] == 2 or form_values['D_subtotal'] == 2:
-            form_values['total'] = 2 
-            page = highlight_box(x_desc[0], y_desc[5], x_desc[1], y_desc[6], page)
-        elif form_values['C_subtotal'] == 1 or form_values['D_subtotal'] == 1:
-            form_values['total'] = 1
-            page = highlight_box(x_desc[0], y_desc[6], x_desc[1], y_desc[7], page)
-        else:
-            form_values['total'] = 0
-            page = highlight_box(x_desc[0], y_desc[7], x_desc[1], y_desc[8], page)
-    elif form_values['A_subtotal'] == 4:
-        form_values['total'] = 4.3
-        page = highlight_box(x_desc[0], y_desc[3], x_desc[1], y_desc[4], page)
-    elif form_values['A_subtotal'] == 5:
-        form_values['total'] = 5
-        page = highlight_box(x_desc[0], y_desc[2], x_desc[1], y_desc[3], page)
-    elif form_values['A_subtotal'] == 6:
-        form_values['total'] = 6
-        page = highlight_box(x_desc[0], y_desc[1], x_desc[1], y_desc[2], page)
-    else:
-        form_values['total'] = 7
-        page = highlight_box(x_desc[0], y_desc[0], x_desc[1], y_desc[1], page)
+    # highlight the description of the CANS level, rows given by index of top edge in y_desc
+    level_rows = {7: 0, 6: 1, 5: 2, 4.3: 3, 4.2: 3, 4.1: 3, 3: 4, 2: 5, 1: 6, 0: 7}
+    row = level_rows[form_values['total']]
+    page = highlight_box(x_desc[0], y_desc[row], x_desc[1], y_desc[row + 1], page)
     
     template = fill_textboxes(general_values, form_values, template) # fill out textboxes
 
@@ -447,21 +451,7 @@ def fill_LSP(general_values:dict, form_values:dict):
         elif score == 3:
             page = highlight_box(x[3] + 10, y[i], x[4] - 10, y[i + 1], page) # bring in the highlight slightly due to formatting
     
-    # perform scoring
-    form_values['a_score'] = form_values[1] + form_values[2] + form_values[3] + form_values[8]
-    form_values['b_score'] = form_values[4] + form_values[5] + form_values[6] + form_values[9] + form_values[16]
-    form_values['c_score'] = form_values[10] + form_values[11] + form_values[12]
-    form_values['d_score'] = form_values[7] + form_values[13] + form_values[14] + form_values[15]
-    
-    # total values and percentage
-    form_values['total'] = form_values['a_score'] + form_values['b_score'] + form_values['c_score'] + form_values['d_score']
-    form_values['total_100'] = str(round(form_values['total'] * 2.0833, 2)) + "/100"
-    
-    # turn into strings for presentation
-    form_values['a_score'] = str(form_values['a_score']) + "/12"
-    form_values['b_score'] = str(form_values['b_score']) + "/15"
-    form_values['c_score'] = str(form_values['c_score']) + "/9" 
-    form_values['d_score'] = str(form_values['d_score']) + "/12"
+    form_values = score_LSP(form_values) # perform scoring
     
     template = fill_textboxes(general_values, form_values, template) # fill out textboxes
 
@@ -475,42 +465,18 @@ def fill_LAWTON(general_values:dict, form_values:dict):
     template = fitz.open('forms/LAWTON.pdf') # read in template pdf
     
     # use text document to highlight relevant rows for each question
-    with open('forms/lawton.txt', 'r') as file:     
-        sections = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H']
-        i = 0 # counter
-        for line in file:
-            options = line.split('/') # each option separated by /
-            
-            # highlight each line, separated by *
-            for opt_line in options[int(form_values[sections[i]]) - 1].split('*'):
-                template = highlight_text(opt_line, template, case_sensitive=False) # highlight relevant number for each column
-            
-            i += 1 # increment
-    
-    # calculate left side total
-    form_values['left_total'] = 0
-    if form_values['A'] != 4:
-        form_values['left_total'] += 1
-    if form_values['B'] == 1:
-        form_values['left_total'] += 1
-    if form_values['C'] == 1:
-        form_values['left_total'] += 1
-    if form_values['D'] != 5:
-        form_values['left_total'] += 1
+    sections = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H']
+    i = 0 # counter
+    for line in read_lines('forms/lawton.txt'):
+        options = line.split('/') # each option separated by /
+        
+        # highlight each line, separated by *
+        for opt_line in options[int(form_values[sections[i]]) - 1].split('*'):
+            template = highlight_text(opt_line, template, case_sensitive=False) # highlight relevant number for each column
         
-    # calcualte right side total
-    form_values['right_total'] = 0
-    if form_values['E'] != 3:
-        form_values['right_total'] += 1
-    if form_values['F'] <= 3:
-        form_values['right_total'] += 1
-    if form_values['G'] == 1:
-        form_values['right_total'] += 1
-    if form_values['H'] != 3:
-        form_values['right_total'] += 1 
-           
-    # calculate total 
-    form_values['total'] = form_values['left_total'] + form_values['right_total']
+        i += 1 # increment
+    
+    form_values = score_LAWTON(form_values) # calculate totals
     
     # fill in fields
     template = fill_textboxes(general_values, form_values, template)
@@ -524,7 +490,7 @@ def fill_BBS(_, form_values:dict):
     
     template = fitz.open('forms/BBS.pdf') # read in template pdf
 
-    total = 0 # to increment for patient total score
+    form_values = score_BBS(form_values) # patient total score
     
     for page in template: # gather fields
         for field in page.widgets():
@@ -537,12 +503,11 @@ def fill_BBS(_, form_values:dict):
                 category, value = key.split('_') # gain values for dictionary
                 
                 if form_values[int(category)] == float(value):
-                    total += int(value) # increase total score
                     field.field_value = True # mark correct checkboxes
                     field.update()
     
     new_dict = {}
-    new_dict['total'] = total # new dictionary for efficiency, don't search through checkboxes
+    new_dict['total'] = form_values['total'] # new dictionary for efficiency, don't search through checkboxes
     template = fill_textboxes({}, new_dict, template) # no general values on BBS form
     
     return template
@@ -560,16 +525,9 @@ def fill_LEFS(general_values:dict, form_values:dict):
     page = template.load_page(0) # load specific page
     pw = page.rect.width # page width
     
-    # track totals
-    new_dict = {} # save in new dict to avoid passing all form_values for efficiency
-    new_dict['total'] = 0
-    new_dict['0_total'] = 0
-    new_dict['1_total'] = 0
-    new_dict['2_total'] = 0
-    new_dict['3_total'] = 0
-    new_dict['4_total'] = 0
+    form_values = score_LEFS(form_values) # total and column totals
     
-    # highlight correct box for each score and increment totals
+    # highlight correct box for each score
     for i in range(20):
         
         # find score
@@ -579,17 +537,15 @@ def fill_LEFS(general_values:dict, form_values:dict):
             page = highlight_box(y[i] + 2, pw - x[1], y[i + 1] - 2, pw - x[0], page) # bring in the highlight slightly due to formatting
         elif score == 1:
             page = highlight_box(y[i] + 2, pw - x[3], y[i + 1] - 2, pw - x[2], page) # bring in the highlight slightly due to formatting
-            new_dict['1_total'] += 1
         elif score == 2:
             page = highlight_box(y[i] + 2, pw - x[5], y[i + 1] - 2, pw - x[4], page) # bring in the highlight slightly due to formatting
-            new_dict['2_total'] += 2
         elif score == 3:
             page = highlight_box(y[i] + 2, pw - x[7], y[i + 1] - 2, pw - x[6], page) # bring in the highlight slightly due to formatting
-            new_dict['3_total'] += 3
         elif score == 4:
             page = highlight_box(y[i] + 2, pw - x[9], y[i + 1] - 2, pw - x[8], page) # bring in the highlight slightly due to formatting
-            new_dict['4_total'] += 4 
-        new_dict['total'] += score # increment total score
+
+    # save in new dict to avoid passing all form_values for efficiency
+    new_dict = {key: form_values[key] for key in ['total', '0_total', '1_total', '2_total', '3_total', '4_total']}
 
     template = fill_textboxes(general_values, new_dict, template) # fill other values
     
@@ -608,7 +564,7 @@ def fill_FRAT(general_values:dict, form_values:dict):
 
     
     page = template.load_page(0) # load FRAT page
-    total = 0 # track total
+    form_values = score_FRAT(form_values) # total and falls risk status
     
     # highlight correct box for each row
     key = 'Recent Falls' # key using 2,4,6,8 scale
@@ -622,7 +578,6 @@ def fill_FRAT(general_values:dict, form_values:dict):
         page = highlight_box(x[0], y[0][2], x[1], y[0][3], page) 
     elif score == 8:
         page = highlight_box(x[0], y[0][3], x[1], y[0][4], page)    
-    total += score # increment score
         
     keys = ['Medications', 'Psychological', 'Cognitive Status'] # keys using 1-4 scale
     
@@ -636,7 +591,6 @@ def fill_FRAT(general_values:dict, form_values:dict):
             page = highlight_box(x[0], y[i][2], x[1], y[i][3], page) 
         elif score == 4:
             page = highlight_box(x[0], y[i][3], x[1], y[i][4], page) 
-        total += score # increment score
     
     # fill checkboxes
     for field in page.widgets():
@@ -649,20 +603,18 @@ def fill_FRAT(general_values:dict, form_values:dict):
                 field.field_value = True # mark checkbox
                 field.update()
     
-    form_values['total'] = total
-    
     # highlight overall risk status
     x = [216.5,248,267,318,342,374]
     y = [502,514]
     
-    # calculate final fall status
-    if form_values['auto_high_1'] == 'Y' or form_values['auto_high_2'] == 'Y' or total >= 16: # high falls risk
+    # final fall status
+    if form_values['risk_status'] == 'HIGH': # high falls risk
         page = highlight_box(x[4], y[0], x[5], y[1], page)
     
-    elif total >= 5 and total <= 11: # medium falls risk
+    elif form_values['risk_status'] == 'MEDIUM': # medium falls risk
         page = highlight_box(x[2], y[0], x[3], y[1], page)
         
-    elif total >= 12 and total <= 15: # low falls risk
+    elif form_values['risk_status'] == 'LOW': # low falls risk
         page = highlight_box(x[0], y[0], x[1], y[1], page)
 
     # fill text fields
@@ -676,16 +628,15 @@ def fill_HONOS(general_values:dict, form_values:dict):
     """
     template = fitz.open('forms/HONOS.pdf') # read in template pdf  
     
-    with open('forms/honos.txt', 'r') as file: # read responses
-        responses = file.readlines()
+    responses = read_lines('forms/honos.txt') # read responses
         
-    total = 0 # track total score
+    form_values = score_HONOS(form_values) # total score
+    
     for i in range(len(responses)):
         options = responses[i].split('_') # different options
         
         value = form_values[i + 1] # value for current question
         opt = options[value]
-        total += value # increment total 
         for line in opt.split('*'): # in case split over multiple lines
             # account for cases where line appears multiple times in the document
             if line == 'No problems of this kind during the period rated':
@@ -698,42 +649,11 @@ def fill_HONOS(general_values:dict, form_values:dict):
             template = highlight_text(line, template, instance, case_sensitive=False) # highlight each line of value
 
     # specifications for question 8
-    for letter in ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J']:
+    for letter, lines in HONOS_PROBLEMS.items():
         if form_values[letter] == 'Y':
-            if letter == 'A':
-                template = highlight_text('A phobic', template)
-                template = highlight_text('A,', template)
-            elif letter == 'B':
-                template = highlight_text('B anxiety', template)
-                template = highlight_text('B,', template)
-            elif letter == 'C':
-                template = highlight_text('C obsessive-compulsive', template)
-                template = highlight_text('C,', template)
-            elif letter == 'D':
-                template = highlight_text('D stress', template)
-                template = highlight_text('D,', template)
-            elif letter == 'E':
-                template = highlight_text('E dissociative', template)
-                template = highlight_text('E,', template)
-            elif letter == 'F':
-                template = highlight_text('F somatoform', template)
-                template = highlight_text('F,', template)
-            elif letter == 'G':
-                template = highlight_text('G eating', template)
-                template = highlight_text('G,', template)
-            elif letter == 'H':
-                template = highlight_text('H sleep', template)
-                template = highlight_text('H,', template) 
-            elif letter == 'I':
-                template = highlight_text('I sexual', template)
-                template = highlight_text('I,', template)
-            elif letter == 'J':
-                template = highlight_text('J other', template)
-                template = highlight_text('J)', template)    
+            for line in lines:
+                template = highlight_text(line, template)
                               
-    # to add in total
-    form_values['total'] = str(total) + '/48'
-    
     # fill in textboxes
     template = fill_textboxes(general_values, form_values, template)
     
@@ -746,11 +666,7 @@ def fill_CASP(general_values:dict, form_values:dict):
     
     template = fitz.open('forms/CASP.pdf') # read in template pdf
     
-    # total values
-    form_values['1_summary'] = 0
-    form_values['2_summary'] = 0
-    form_values['3_summary'] = 0
-    form_values['4_summary'] = 0
+    form_values = score_CASP(form_values) # section summaries and total
     
     for page in template: # gather fields
         for field in page.widgets():
@@ -762,29 +678,10 @@ def fill_CASP(general_values:dict, form_values:dict):
                 
                 category, value = key.split('_') # gain values for dictionary
                 
-                # calculate totals
                 if form_values[int(category)] == float(value):
-                    if int(category) >= 1 and int(category) <= 6:
-                        form_values['1_summary'] += int(value)
-                    elif int(category) >= 6 and int(category) <= 10:
-                        form_values['2_summary'] += int(value)
-                    elif int(category) >= 10 and int(category) <= 15:
-                        form_values['3_summary'] += int(value)
-                    elif int(category) >= 15 and int(category) <= 20:
-                        form_values['4_summary'] += int(value)
                     field.field_value = True # mark correct checkboxes
                     field.update()
     
-    # form totals
-    total = form_values['1_summary'] + form_values['2_summary'] + form_values['3_summary'] + form_values['4_summary'] 
-    form_values['total'] = 'Total: ' + str(total) + '/80 = ' + str(round((total/80)*100, 2)) + '%'
-
-    # totals as full strings
-    form_values['1_summary'] = str(form_values['1_summary']) + '/24'
-    form_values['2_summary'] = str(form_values['2_summary']) + '/16'
-    form_values['3_summary'] = str(form_values['3_summary']) + '/20'
-    form_values['4_summary'] = str(form_values['4_summary']) + '/20'
-    
     template = fill_textboxes(general_values, form_values, template)
     
     return template
@@ -795,24 +692,16 @@ def fill_HONOSCA(general_values:dict, form_values:dict):
     """
     template = fitz.open('forms/HONOSCA.pdf') # read in template pdf  
 
-    total = 0 # track total score
-    A_total = 0 # track A subtotal
-    
-    for i in range(1, 14):
-        A_total += form_values[i]
-    
-    total = A_total + form_values[14] + form_values[15]
-    
-    form_values['total'] = total
-    form_values['A_total'] = A_total
+    form_values = score_HONOSCA(form_values) # section A and overall totals
 
     template = fill_textboxes(general_values, form_values, template)
     
     return template
 
-def produce_output(master:dict[dict]):
+def produce_output(master:dict[dict], zoom=2, progress=None):
     """
     Calls form filling function for each dictionary read in from excel and combines pdfs to final file. 
+    progress, if given, is called with the stage, form name and seconds taken as each form is filled and rendered.
     """
     
     combined = fitz.open() # new document to return
@@ -823,12 +712,164 @@ def produce_output(master:dict[dict]):
             
             if function_name: # check function exists to prevent errors
                 
+                start = time.perf_counter()
                 filled_form = function_name(master['GENERAL'], master[key])
-                rendered_pdf = render_to_image(filled_form) # this is a workaround to fuse field values to page 
+                if progress:
+                    progress('filled', key, time.perf_counter() - start)
+                
+                start = time.perf_counter()
+                rendered_pdf = render_to_image(filled_form, zoom) # this is a workaround to fuse field values to page 
                 combined.insert_pdf(rendered_pdf) # append to combined
+                if progress:
+                    progress('rendered', key, time.perf_counter() - start)
                 
     return combined
 
+def output_key(data:bytes, zoom):
+    """
+    Returns the key of the PDF generated from workbook data at zoom in rendered_outputs.
+    Includes today's date, as ages are calculated from it, and the version of the templates and code.
+    """
+    
+    return f"{hashlib.sha256(data).hexdigest()}/{zoom}/{datetime.today().date()}/{OUTPUT_VERSION}"
+
+def template_error(filename:str):
+    """
+    Error message for a workbook that could not be read or processed, most likely because it doesn't follow the template.
+    """
+    
+    return f"There is an issue with {filename}. Please ensure the correct template has been used. If errors reoccur, redownload the template and try again."
+
+def sandbox_error(filename:str, error):
+    """
+    Error message for a workbook whose sandbox process was stopped or died, from the SandboxError raised.
+    """
+    
+    return f"There is an issue with {filename}: it {error}. Please check the file for unusually large or unexpected values."
+
+def process_workbook(file, directory:str, zoom=2, progress=None, captured=None):
+    """
+    Reads, validates and generates the PDF for one uploaded workbook, reading and generating in the workbook's sandbox.
+    Returns the path of the PDF, a new hidden file in directory, or None and a list of errors. progress, if given, is called
+    with each stage as in produce_output, and must be picklable to reach the sandbox. A workbook already generated by any
+    worker is copied from rendered_outputs, unless captured is given: then the file's workload record is appended to it,
+    which needs the workbook read.
+    """
+    
+    data = file.read()
+    key = output_key(data, zoom)
+    pdf_data = rendered_outputs.get(key) if captured is None else None
+    if pdf_data is not None:
+        fd, pdf_path = tempfile.mkstemp(prefix='.', suffix='.pdf', dir=directory)
+        with os.fdopen(fd, 'wb') as pdf_file:
+            pdf_file.write(pdf_data)
+        if progress:
+            progress('cached')
+        return pdf_path, []
+    
+    deadline = workbook_deadline() # reading and generating share one time limit per workbook
+    try:
+        start = time.perf_counter()
+        master = run_sandboxed(read_excel, io.BytesIO(data), deadline=deadline)
+        if progress:
+            progress('parsed', None, time.perf_counter() - start)
+    except SandboxError as error:
+        if captured is not None:
+            captured.append(capture_file(file))
+        return None, [sandbox_error(file.filename, error)]
+    except Exception:
+        if captured is not None:
+            captured.append(capture_file(file))
+        return None, [template_error(file.filename)]
+    
+    start = time.perf_counter()
+    error_list = validate_columns(master, file.filename)
+    if captured is not None:
+        captured.append(capture_file(file, master, error_list))
+    if error_list:
+        return None, error_list
+    if progress:
+        progress('validated', None, time.perf_counter() - start)
+    
+    fd, pdf_path = tempfile.mkstemp(prefix='.', suffix='.pdf', dir=directory) # private to this user, and the sandbox writes to it
+    os.close(fd)
+    try: # use try in case validation misses an error
+        run_sandboxed(render_pdf, master, zoom, progress, pdf_path, deadline=deadline)
+    except Exception as error:
+        os.remove(pdf_path)
+        if isinstance(error, SandboxError):
+            return None, [sandbox_error(file.filename, error)]
+        return None, [template_error(file.filename)]
+    
+    if os.path.getsize(pdf_path) <= rendered_outputs.max_bytes: # larger outputs are never cached, so skip reading them
+        with open(pdf_path, 'rb') as pdf_file:
+            rendered_outputs.set(key, pdf_file.read())
+    return pdf_path, []
+
+def render_pdf(master:dict[dict], zoom=2, progress=None, path=None):
+    """
+    Produces the combined PDF for a master dictionary. Saves it to path if given, so a sandbox can hand back a large PDF
+    without sending it through a pipe, and otherwise returns it as bytes.
+    """
+    
+    if path is not None:
+        produce_output(master, zoom, progress).save(path)
+        os.chmod(path, 0o600) # saving creates the file anew, with the default mode
+        return path
+    
+    pdf_stream = io.BytesIO()
+    produce_output(master, zoom, progress).save(pdf_stream)
+    
+    return pdf_stream.getvalue()
+
+def score_workbook(stream, filename:str):
+    """
+    Reads and validates one workbook and calculates its scores without generating any documents.
+    Returns the scores of each form, keyed by form name and score name, and a list of errors.
+    """
+    
+    try:
+        master = read_excel(stream)
+    except Exception:
+        return {}, [template_error(filename)]
+    
+    error_list = validate_columns(master, filename)
+    if error_list:
+        return {}, error_list
+    
+    try: # use try in case validation misses an error
+        scores = compute_scores(master)
+    except Exception:
+        return {}, [template_error(filename)]
+    
+    # string keys and no NaN so the scores can be written as JSON or CSV
+    return {form: {str(k): None if isinstance(v, float) and math.isnan(v) else v for k, v in values.items()}
+            for form, values in scores.items()}, []
+
+def fill_preview(data:bytes, form_name:str):
+    """
+    Reads a workbook stored for previewing and fills one of its forms, so it can be done in another process.
+    Returns the filled form as bytes, or None if the workbook has no such form.
+    """
+    
+    master = read_excel(io.BytesIO(data))
+    validate_columns(master, '') # fills empty optional entries as for the real document, errors were reported by preview_workbook
+    if form_name not in master:
+        return None
+    
+    return globals()[f"fill_{form_name}"](master['GENERAL'], master[form_name]).tobytes()
+
+def preview_thumbnail(form_bytes:bytes, page_number:int):
+    """
+    Renders one page of a filled form from fill_preview as a thumbnail, so it can be done in another process.
+    Returns the PNG bytes, or None if the form has fewer pages.
+    """
+    
+    with fitz.open("pdf", form_bytes) as filled_form:
+        if page_number >= filled_form.page_count:
+            return None
+        return render_thumbnail(filled_form, page_number)
+
 @app.route('/')
 @login_required
 def index():
@@ -839,10 +880,11 @@ def index():
 def download_template():
     """Serve the Excel template for download."""
     
-    template_path = '../template.xlsx'  # Path to the Excel template
-    return send_file(template_path, as_attachment=True)
+    return send_file(TEMPLATE_PATH, as_attachment=True)
 
 @app.route('/upload', methods=['POST'])
+@profiled
+@admission_controlled
 def upload_files():
     """Handle file upload and return a zip file of processed PDFs."""
    
@@ -860,70 +902,272 @@ def upload_files():
     memory_file = io.BytesIO()
     errors = {}
     
-    with zipfile.ZipFile(memory_file, 'w') as zf:
-        for file in files:
-            if file and file.filename.endswith('.xlsx'):
-                # Ensure the filename is secure
-                filename = secure_filename(file.filename)
-                try:
-                    # Read the Excel file
-                    master = read_excel(file.stream)  # Function to read the Excel file
-                except Exception:
-                    errors[file.filename] = [f"There is an issue with {file.filename}. Please ensure the correct template has been used. If errors reoccur, redownload the template and try again."]
-                    return jsonify({"errors": errors}), 400
-                
-                # Validate the file contents
-                error_list = validate_columns(master, file.filename)
-                if error_list:
-                    errors[file.filename] = error_list  # Updated validation that allows trailing empty rows
-                
-                try: # use try in case validation misses an error
-                    if all(not lst for lst in errors.values()): # prevent errors
-                        final_document = produce_output(master)  # Function to generate the PDF from the DataFrame
-
-                        # Store the PDF in memory
-                        pdf_stream = io.BytesIO()
-                        final_document.save(pdf_stream)
-                        pdf_stream.seek(0)  # Reset the stream position
-
+    # optionally keep a scrubbed copy of this upload for replaying in performance tests
+    captured = [] if capture_enabled() else None
+    started = time.perf_counter()
+    output_dir = tempfile.mkdtemp() # readable only by this user, holds each PDF until it is zipped
+    
+    try:
+        with zipfile.ZipFile(memory_file, 'w') as zf:
+            for file in files:
+                if file and file.filename.endswith('.xlsx'):
+                    # Ensure the filename is secure
+                    filename = secure_filename(file.filename)
+                    
+                    # read, validate and generate in the workbook's sandbox, at lower resolution under heavy load
+                    pdf_path, error_list = process_workbook(file, output_dir, g.render_zoom, captured=captured)
+                    if error_list:
+                        errors[file.filename] = error_list # later files are still processed, so all errors are reported at once
+                    else:
                         # Add the PDF to the zip file
                         pdf_filename = filename.replace('.xlsx', '')
-                        zf.writestr(f'{pdf_filename}.pdf', pdf_stream.read())
-                except Exception:
-                    errors[file.filename] = [f"There is an issue with {file.filename}. Please ensure the correct template has been used. If errors reoccur, redownload the template and try again."]
-
+                        zf.write(pdf_path, f'{pdf_filename}.pdf')
+                        os.remove(pdf_path)
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
 
     memory_file.seek(0)  # Reset the in-memory zip file position
     
+    if captured is not None:
+        record_upload(captured, time.perf_counter() - started, 400 if errors else 200)
+    
     if errors:
         return jsonify({"errors": errors}), 400
     else:
         # Return the zip file as a downloadable response
         return send_file(memory_file, download_name='processed_files.zip', as_attachment=True)
     
+@app.route('/batch', methods=['POST'])
+@login_required
+def start_batch():
+    """Start a batch of files that are uploaded and processed one at a time, and return its ID."""
+    
+    owner = session.setdefault('id', uuid.uuid4().hex)
+    
+    # progress can be streamed when asgi.py holds the stream open on its event loop, not in a worker or thread, and the
+    # page sends no more files at once than can render, so its own files don't take each other's render slots
+    return jsonify({"id": create_batch(owner), "stream": bool(request.environ.get('form_creator.event_stream')),
+                    "files_in_flight": min(MAX_RENDER_JOBS, MAX_SESSION_FILES)})
+
+@app.route('/batch/<batch_id>/files', methods=['POST'])
+@login_required
+@profiled
+@admission_controlled
+def batch_file(batch_id):
+    """Process one file of a batch as soon as it arrives and keep the result for finish_batch. Sending a file again replaces its result."""
+    
+    path = batch_path(batch_id, session.get('id', ''))
+    if path is None:
+        return "Batch not found", 404
+    
+    file = request.files.get('files[]') # same field as /upload so admission control counts it
+    if not file or not file.filename.endswith('.xlsx'):
+        return "No selected file", 400
+    
+    name = secure_filename(file.filename).replace('.xlsx', '')
+    progress = partial(record_event, path, file.filename) # picklable, so the sandbox can report each form
+    
+    captured = [] if capture_enabled() else None # recorded as a one file upload for replaying in performance tests
+    started = time.perf_counter()
+    progress('received')
+    pdf_path, error_list = process_workbook(file, path, g.render_zoom, progress, captured) # at lower resolution under heavy load
+    
+    if captured is not None:
+        record_upload(captured, time.perf_counter() - started, 400 if error_list else 200)
+    
+    if error_list:
+        save_errors(path, name, error_list)
+        progress('failed', None, time.perf_counter() - started)
+        return jsonify({"errors": {file.filename: error_list}}), 400
+    
+    save_result(path, name, pdf_path)
+    progress('done', None, time.perf_counter() - started)
+    return jsonify({"file": file.filename, "pdf": f"{name}.pdf"})
+
+@app.route('/batch/<batch_id>/finish', methods=['POST'])
+@login_required
+def finish_batch(batch_id):
+    """Return a zip file of the PDFs already generated for a batch. Files not yet processed, or with errors, are reported instead."""
+    
+    path = batch_path(batch_id, session.get('id', ''))
+    if path is None:
+        return "Batch not found", 404
+    
+    filenames = (request.get_json(silent=True) or {}).get('files', [])
+    if not filenames:
+        return "No selected file", 400
+    
+    results = {}
+    errors = {}
+    for filename in filenames:
+        name = secure_filename(filename).replace('.xlsx', '')
+        results[name] = result_path(path, name)
+        if results[name] is None:
+            errors[filename] = load_errors(path, name) or [f"{filename} has not been processed yet. Please upload it again."]
+    
+    if errors:
+        return jsonify({"errors": errors}), 400
+    
+    # built on disk rather than in memory, batches can be larger than a single upload
+    started = time.perf_counter()
+    zip_path = os.path.join(path, 'processed_files.zip')
+    fd, temp_path = tempfile.mkstemp(dir=path, prefix='.tmp-') # readable only by this user, like the batch's other files
+    try:
+        with os.fdopen(fd, 'wb') as zip_file, zipfile.ZipFile(zip_file, 'w') as zf:
+            for name, result in results.items():
+                zf.write(result, f'{name}.pdf')
+        os.replace(temp_path, zip_path) # a finished zip is always complete, even if the same batch is finished twice at once
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    record_event(path, None, 'zipped', None, time.perf_counter() - started)
+    
+    return send_file(zip_path, download_name='processed_files.zip', as_attachment=True)
+
+@app.route('/batch/<batch_id>/events')
+@login_required
+def batch_events(batch_id):
+    """
+    Report the progress of a batch as JSON: each file's stages after ?after=N with the seconds they took, for polling.
+    Under asgi.py, clients asking for text/event-stream get a Server-Sent Events stream from the event loop instead.
+    """
+    
+    path = batch_path(batch_id, session.get('id', ''))
+    if path is None:
+        return "Batch not found", 404
+    
+    after = events_after(request.headers.get('Last-Event-ID') or request.args.get('after')) # events the client already has
+    events = read_events(path, after)
+    return jsonify({"events": events, "next": after + len(events)})
+
+@app.route('/scores', methods=['POST'])
+@login_required
+def score_files():
+    """Handle file upload and return the computed scores of each file as JSON, or as CSV with format=csv."""
+    
+    files = [f for f in request.files.getlist('files[]') if f and f.filename.endswith('.xlsx')]
+    if not files:
+        return "No selected file", 400
+    
+    results = {}
+    errors = {}
+    # one sandbox process scores every workbook in turn, starting a process per workbook would take longer than scoring it
+    outcomes = run_sandboxed_each(score_workbook, [(io.BytesIO(file.read()), file.filename) for file in files])
+    for file, outcome in zip(files, outcomes):
+        if isinstance(outcome, SandboxError):
+            scores, error_list = {}, [sandbox_error(file.filename, outcome)]
+        elif isinstance(outcome, Exception):
+            raise outcome # score_workbook reports problems with the workbook itself as errors
+        else:
+            scores, error_list = outcome
+        if error_list:
+            errors[file.filename] = error_list
+        results[file.filename] = scores
+    
+    if errors:
+        return jsonify({"errors": errors}), 400
+    
+    if request.values.get('format') == 'csv':
+        # one row per score
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(['file', 'form', 'score', 'value'])
+        for filename, scores in results.items():
+            for form, values in scores.items():
+                for key, value in values.items():
+                    writer.writerow([filename, form, key, value])
+        return output.getvalue(), 200, {'Content-Type': 'text/csv; charset=utf-8', 'Content-Disposition': 'attachment; filename=scores.csv'}
+    
+    return jsonify(results)
+
+@app.route('/preview', methods=['POST'])
+@login_required
+def preview_workbook():
+    """
+    Store an uploaded workbook for previewing and return the forms and page counts that can be previewed.
+    Pages are only filled and rendered once requested through preview_page.
+    """
+    
+    file = request.files.get('file')
+    if not file or file.filename == '':
+        return "No selected file", 400
+    
+    data = file.read()
+    workbook_id = hashlib.sha256(data).hexdigest() # identical workbooks share cached previews
+    
+    try:
+        master = run_sandboxed(read_excel, io.BytesIO(data), deadline=workbook_deadline())
+    except SandboxError as error:
+        return jsonify({"errors": {file.filename: [sandbox_error(file.filename, error)]}}), 400
+    except Exception:
+        return jsonify({"errors": {file.filename: [template_error(file.filename)]}}), 400
+    
+    error_list = validate_columns(master, file.filename)
+    if error_list:
+        return jsonify({"errors": {file.filename: error_list}}), 400
+    
+    preview_workbooks.set(workbook_id, data)
+    
+    # list forms that would be generated, page counts taken from the blank templates
+    forms = []
+    for key in master.keys():
+        if key != 'GENERAL' and globals().get(f"fill_{key}"):
+            forms.append({"name": key, "pages": template_page_count(key)}) # counted at startup, no PDF work in the request thread
+    
+    return jsonify({"id": workbook_id, "forms": forms})
+
+@app.route('/preview/<workbook_id>/<form_name>/<int:page_number>.png')
+@login_required
+def preview_page(workbook_id, form_name, page_number):
+    """
+    Return a thumbnail of one page of a filled form from a workbook previously sent to preview_workbook.
+    """
+    
+    today = datetime.today().date() # ages are calculated from today's date, so fill again each day
+    image_key = f"{workbook_id}/{form_name}/{page_number}/{PREVIEW_DPI}/{today}/{OUTPUT_VERSION}"
+    image = preview_images.get(image_key)
+    
+    if image is None:
+        if not globals().get(f"fill_{form_name}"):
+            return "Form not found", 404
+        
+        deadline = workbook_deadline() # filling and rendering share one time limit, as for uploads
+        
+        # fill the form once per workbook, other pages of the same form reuse it
+        form_key = f"{workbook_id}/{form_name}/{today}/{OUTPUT_VERSION}"
+        form_bytes = preview_images.get(form_key)
+        if form_bytes is None:
+            data = preview_workbooks.get(workbook_id)
+            if data is None:
+                return "Preview expired, please upload the file again", 404
+            
+            # filled and rendered in the workbook sandbox like uploads, which also keeps PyMuPDF out of request threads
+            try:
+                form_bytes = run_sandboxed(fill_preview, data, form_name, deadline=deadline)
+            except SandboxError as error:
+                return f"The preview {error}", 400
+            if form_bytes is None:
+                return "Form not found", 404
+            preview_images.set(form_key, form_bytes)
+        
+        try:
+            image = run_sandboxed(preview_thumbnail, form_bytes, page_number, deadline=deadline)
+        except SandboxError as error:
+            return f"The preview {error}", 400
+        if image is None:
+            return "Page not found", 404
+        preview_images.set(image_key, image)
+    
+    return send_file(io.BytesIO(image), mimetype='image/png')
+
 @app.route('/download-form/<form_name>')
 def download_form(form_name):
     """
     Route to download specific forms.
     """
-    # Map form_name to actual file paths
-    form_files = {
-        'whodas': 'WHODAS.pdf',
-        'whodas-youth': 'WHODASKIDS.pdf',
-        'cans': 'CANS.pdf',
-        'lsp': 'LSP.pdf',
-        'lawton-brody-iadl': 'LAWTON.pdf',
-        'lefs': 'LEFS.pdf',
-        'berg-balance-scale': 'BBS.pdf',
-        'frat': 'FRAT.pdf',
-        'honos': 'HONOS.pdf',
-        'casp': 'CASP.pdf',
-        'honosca':'HONOSCA.pdf'
-    }
-    
     # Ensure the form exists
-    if form_name in form_files:
-        return send_from_directory(directory='forms', path=form_files[form_name], as_attachment=True)
+    if form_name in FORM_FILES:
+        return send_from_directory(directory='forms', path=FORM_FILES[form_name], as_attachment=True)
     else:
         return "Form not found", 404
 
@@ -0,0 +1,48 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import threading
+
+from profiling import add_child_profile, profile_call, profiling_active
+from warmup import warm_up
+
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", os.cpu_count() or 1)) # processes running CPU-heavy work when offloading is started
+
+_executor = None # process pool, None to run work in the calling thread
+_executor_lock = threading.Lock()
+
+def start(max_workers:int=CPU_WORKERS):
+    """
+    Starts the process pool used by run_cpu. Until this is called, or after shutdown, work runs in the calling thread as before.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn rather than fork, the serving process has an event loop and threads running
+            _executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=warm_up)
+
+def shutdown():
+    """
+    Stops the process pool, waiting for running work to finish.
+    """
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown()
+
+def run_cpu(function, *args):
+    """
+    Calls function(*args) in the process pool if it has been started, otherwise in the calling thread, and returns the result.
+    function must be defined at module level and its arguments and result must be picklable. If the request is being
+    profiled, the call is profiled in the pool and its stats are added to the request's profile.
+    """
+    executor = _executor
+    if executor is None:
+        return function(*args)
+    if profiling_active():
+        result, stats = executor.submit(profile_call, function, *args).result()
+        add_child_profile(stats)
+        return result
+    return executor.submit(function, *args).result() # blocks only this request's thread, never the event loop
@@ -0,0 +1,4 @@
+# imported by the sandbox's forkserver, so every workbook process is forked with the app imported and its caches warm
+from warmup import warm_up
+
+warm_up()
@@ -0,0 +1,128 @@
+from flask import Blueprint, request, jsonify, send_from_directory, make_response
+from functools import wraps
+from datetime import datetime
+import cProfile
+import hmac
+import os
+import pstats
+import random
+import threading
+import time
+
+PROFILE_TOKEN = os.getenv("FORM_CREATOR_PROFILE_TOKEN") # profiling is disabled unless set
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0)) # fraction of requests profiled without being asked
+PROFILE_DIR = os.path.abspath(os.getenv("PROFILE_DIR", "profiles"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", 50)) # number of dumps kept on disk
+
+profiling = Blueprint("profiling", __name__)
+
+_profiling = threading.local() # profiles sent back by other processes working for the request profiled in this thread
+
+def is_admin():
+    """
+    Checks the X-Profile-Token header of the current request against the configured token.
+    """
+    token = request.headers.get("X-Profile-Token", "")
+    return bool(PROFILE_TOKEN) and hmac.compare_digest(token, PROFILE_TOKEN)
+
+def admin_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not is_admin():
+            return "Not found", 404 # don't reveal that profiling exists
+        return f(*args, **kwargs)
+    return decorated_function
+
+class ProfileStats:
+    """
+    Stats of a profiler in another process, in the form pstats.Stats loads from a profiler.
+    """
+
+    def __init__(self, stats:dict):
+        self.stats = stats
+
+    def create_stats(self):
+        pass # already created in the other process
+
+def profiling_active():
+    """
+    Checks whether the request handled by this thread is being profiled, so work it hands to other processes should be too.
+    """
+    return getattr(_profiling, "children", None) is not None
+
+def profile_call(function, *args):
+    """
+    Calls function(*args) under its own profiler, in a process working for a profiled request.
+    Returns the result and the profile stats for add_child_profile.
+    """
+    profiler = cProfile.Profile()
+    result = profiler.runcall(function, *args)
+    profiler.create_stats()
+    return result, profiler.stats
+
+def add_child_profile(stats:dict):
+    """
+    Adds stats from profile_call to the profile of the request handled by this thread.
+    """
+    if profiling_active():
+        _profiling.children.append(stats)
+
+def save_profile(profiler, elapsed, children=()):
+    """
+    Writes the profile, merged with those of other processes working for the request, in pstats format to PROFILE_DIR
+    and removes the oldest dumps beyond PROFILE_KEEP. Returns the file name of the dump.
+    """
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{request.endpoint}-{round(elapsed * 1000)}ms.prof"
+    stats = pstats.Stats(profiler)
+    for child in children:
+        stats.add(pstats.Stats(ProfileStats(child)))
+    stats.dump_stats(os.path.join(PROFILE_DIR, name))
+
+    dumps = sorted(f for f in os.listdir(PROFILE_DIR) if f.endswith(".prof")) # names start with a timestamp
+    for old in dumps[:-PROFILE_KEEP]:
+        os.remove(os.path.join(PROFILE_DIR, old))
+
+    return name
+
+def profiled(f):
+    """
+    Profiles the view when an admin asks for it with the X-Profile: 1 header, or at random for PROFILE_SAMPLE_RATE of requests.
+    The view is returned unwrapped when profiling is disabled, so unprofiled requests pay nothing.
+    """
+    if not PROFILE_TOKEN:
+        return f
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        requested = request.headers.get("X-Profile") == "1" and is_admin()
+        if not requested and random.random() >= PROFILE_SAMPLE_RATE:
+            return f(*args, **kwargs)
+
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        _profiling.children = []
+        try:
+            response = make_response(profiler.runcall(f, *args, **kwargs))
+        finally:
+            children, _profiling.children = _profiling.children, None
+        name = save_profile(profiler, time.perf_counter() - start, children)
+
+        if requested:
+            response.headers["X-Profile-Id"] = name # lets the admin download this request's dump
+        return response
+    return decorated_function
+
+@profiling.route("/profiles")
+@admin_required
+def list_profiles():
+    """List stored profile dumps, newest first."""
+    if not os.path.isdir(PROFILE_DIR):
+        return jsonify([])
+    return jsonify(sorted((f for f in os.listdir(PROFILE_DIR) if f.endswith(".prof")), reverse=True))
+
+@profiling.route("/profiles/<name>")
+@admin_required
+def download_profile(name):
+    """Download a profile dump, readable with pstats, snakeviz or flameprof."""
+    return send_from_directory(PROFILE_DIR, name, as_attachment=True)
@@ -0,0 +1,163 @@
+import multiprocessing
+import os
+import time
+
+from offload import run_cpu
+from profiling import add_child_profile, profile_call, profiling_active
+
+try:
+    import resource # memory limits for worker processes
+except ImportError: # not available on Windows, only the time limit then applies
+    resource = None
+
+WORKBOOK_TIMEOUT = float(os.getenv("WORKBOOK_TIMEOUT", 60)) # seconds one workbook may take to read and generate, 0 for no limit, kept below the gunicorn timeout
+WORKBOOK_MEMORY_MB = int(os.getenv("WORKBOOK_MEMORY_MB", 2048)) # address space one workbook's process may use, 0 for no limit
+SANDBOX_ENABLED = os.getenv("WORKBOOK_SANDBOX", "1") != "0" # run each workbook in its own process
+
+if "forkserver" in multiprocessing.get_all_start_methods():
+    # processes are forked from a server that has already imported main and warmed its caches, so starting
+    # one is cheap and doesn't copy the threads or open documents of the serving process
+    _context = multiprocessing.get_context("forkserver")
+    _context.set_forkserver_preload(["prewarmed"])
+else:
+    _context = multiprocessing.get_context("spawn")
+
+def start():
+    """
+    Starts this process's forkserver now rather than on the first upload. It imports the app and warms its caches in the background.
+    """
+    if SANDBOX_ENABLED and _context.get_start_method() == "forkserver":
+        from multiprocessing import forkserver
+        forkserver.ensure_running()
+
+class SandboxError(Exception):
+    """
+    Raised when a workbook's process is stopped or dies before returning a result.
+    """
+
+class SandboxTimeout(SandboxError):
+    """
+    Raised when a workbook's process is stopped for exceeding WORKBOOK_TIMEOUT.
+    """
+
+class SandboxMemoryError(SandboxError):
+    """
+    Raised when a workbook's process runs out of the memory allowed by WORKBOOK_MEMORY_MB.
+    """
+
+def workbook_deadline():
+    """
+    Returns the time.monotonic() value by which a workbook started now must be finished, or None if there is no time limit.
+    """
+    return time.monotonic() + WORKBOOK_TIMEOUT if WORKBOOK_TIMEOUT else None
+
+def _run_child(connection, memory_mb:int, function, calls:list):
+    """
+    Entry point of a workbook's process. Applies the memory limit, then calls function with each argument tuple in calls,
+    sending back each result or exception as it finishes. Stops after running out of memory, as the process may be unusable.
+    """
+    if resource is not None and memory_mb:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    for args in calls:
+        try:
+            result = ("result", function(*args))
+        except MemoryError:
+            result = ("memory", None)
+        except Exception as error:
+            # MuPDF reports failed allocations as its own error type rather than MemoryError
+            result = ("memory", None) if "malloc" in str(error) else ("error", error)
+
+        try:
+            connection.send(result)
+        except MemoryError:
+            result = ("memory", None)
+            connection.send(result)
+        except Exception: # exception could not be pickled, send its description instead
+            connection.send(("error", RuntimeError(repr(result[1]))))
+        if result[0] == "memory":
+            break
+    connection.close()
+
+def _run_calls(function, calls:list, next_deadline):
+    """
+    Calls function with each argument tuple in calls in a process limited to WORKBOOK_MEMORY_MB, reused from one call to the
+    next, and returns a list of each call's outcome: True and the result, or False and the exception raised. next_deadline()
+    is called as each call starts for the time.monotonic() value at which it is stopped, or None for no limit. A call that is
+    stopped or kills the process gives a SandboxError, and the remaining calls continue in a new process.
+    """
+    profiled = profiling_active()
+    if profiled:
+        function, calls = profile_call, [(function, *args) for args in calls]
+
+    outcomes = []
+    while len(outcomes) < len(calls):
+        receiver, sender = _context.Pipe(duplex=False)
+        process = _context.Process(target=_run_child, args=(sender, WORKBOOK_MEMORY_MB, function, calls[len(outcomes):]), daemon=True)
+        process.start()
+        sender.close() # only the child holds the sending end, so its death is seen as end of file
+
+        try:
+            while len(outcomes) < len(calls):
+                deadline = next_deadline()
+                timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+                if not receiver.poll(timeout):
+                    outcomes.append((False, SandboxTimeout(f"took longer than {WORKBOOK_TIMEOUT:g} seconds to process and was stopped")))
+                    break
+                try:
+                    status, value = receiver.recv()
+                except EOFError:
+                    process.join()
+                    outcomes.append((False, SandboxError(f"stopped unexpectedly with exit code {process.exitcode}")))
+                    break
+
+                if status == "memory":
+                    outcomes.append((False, SandboxMemoryError(f"needed more than {WORKBOOK_MEMORY_MB} MB of memory to process and was stopped")))
+                    break
+                if status == "error":
+                    outcomes.append((False, value))
+                    continue
+                if profiled:
+                    value, stats = value
+                    add_child_profile(stats)
+                outcomes.append((True, value))
+        finally:
+            if process.is_alive():
+                process.kill()
+            process.join()
+            receiver.close()
+
+    return outcomes
+
+def run_sandboxed(function, *args, deadline=None):
+    """
+    Calls function(*args) in a new process limited to WORKBOOK_MEMORY_MB and returns the result. The process is killed if it
+    is still running at deadline, from workbook_deadline(), and SandboxTimeout is raised. Exceptions raised by function are
+    raised again here. When the sandbox is disabled the call goes to run_cpu instead. If the request is being profiled, the
+    process profiles the call and its stats are added to the request's profile.
+    """
+    if not SANDBOX_ENABLED:
+        return run_cpu(function, *args)
+
+    [(succeeded, value)] = _run_calls(function, [args], lambda: deadline)
+    if not succeeded:
+        raise value
+    return value
+
+def run_sandboxed_each(function, calls:list):
+    """
+    Calls function(*args) for each argument tuple in calls, like run_sandboxed but in one process reused from one call to
+    the next, with WORKBOOK_TIMEOUT seconds for each call. Returns each call's result, or in its place the exception it
+    raised, a SandboxError if it was stopped. When the sandbox is disabled the calls go to run_cpu instead.
+    """
+    if not SANDBOX_ENABLED:
+        results = []
+        for args in calls:
+            try:
+                results.append(run_cpu(function, *args))
+            except Exception as error:
+                results.append(error)
+        return results
+
+    return [value for _, value in _run_calls(function, calls, workbook_deadline)]
@@ -0,0 +1,354 @@
+import math
+
+
+def score_WHODAS(form_values:dict):
+    """
+    Calculates WHODAS section totals, averages and percentages and stores them in form_values.
+    If part 2 of section 5 is left empty its answers are set to N/A.
+    """
+
+    # calculate extra fields
+    for i in range(1,7):
+        if i != 5: # 5 is an edge case
+
+            number_params = sum(1 for key, _ in form_values.items() if key.startswith('D' + str(i)))
+            total = sum(value for key, value in form_values.items() if key.startswith('D' + str(i)))
+
+            form_values[str(i) + '_overall'] = total
+            form_values[str(i) + '_avg'] = round(total/number_params , 1)
+            form_values[str(i) + '_percent'] = str(round((total/(number_params * 5)) * 100 , 1)) + "%"
+
+    # calculate values for section 5 part 1
+    form_values['5_overall'] = form_values['D51'] + form_values['D52'] + form_values['D53'] + form_values['D54']
+    form_values['5_avg'] = round(form_values['5_overall'] / 4, 1)
+    form_values['5_percent'] = str(round((form_values['5_overall'] / 20) * 100, 1)) + '%'
+
+    # calculate values for section 5 part 2
+    form_values['5_overall2'] = form_values['D55'] + form_values['D56'] + form_values['D57'] + form_values['D58']
+    form_values['5_avg2'] = round(form_values['5_overall2'] / 4, 1)
+    form_values['5_percent2'] = str(round((form_values['5_overall2'] / 20) * 100, 1)) + '%'
+
+    # if part 2 of 5 is N/A and left empty
+    if math.isnan(form_values['5_overall2']):
+        form_values['D55'], form_values['D56'], form_values['D57'], form_values['D58'], form_values['5_avg2'], form_values['5_overall2'], form_values['5_percent2']  = "N/A", "N/A", "N/A", "N/A", "N/A", "N/A", "" # will appear on document as N/A
+
+        # find total values, counting an extra 20 for part 2
+        form_values['total'] = form_values['1_overall'] + form_values['2_overall'] + form_values['3_overall'] + form_values['4_overall'] + form_values['5_overall'] + form_values['6_overall'] + 20
+
+    else: # total values is equal to all sections combined
+        form_values['total'] = form_values['1_overall'] + form_values['2_overall'] + form_values['3_overall'] + form_values['4_overall'] + form_values['5_overall'] + form_values['5_overall2'] + form_values['6_overall']
+
+    # calculate final extra values using total
+    form_values['avg'] = round(form_values['total'] / 36, 1)
+    form_values['percent'] = 'Total Score: ' + str(round((form_values['total'] / 180) * 100, 1)) + '%'
+
+    return form_values
+
+def score_WHODASKIDS(form_values:dict):
+    """
+    Calculates WHODAS child and adolescent section totals and percentages and stores them in form_values.
+    If part 2 of section 5 is left empty its answers are set to N/A.
+    """
+
+    # calculate extra fields
+    for i in range(1,7):
+        if i != 5: # section 5 is edge case
+            number_params = sum(1 for key, _ in form_values.items() if isinstance(key, int) and key // 10 == i) # number of keys in section
+            total = sum(value for key, value in form_values.items() if isinstance(key, int) and key // 10 == i)
+
+            form_values[str(i) + '_total'] = total
+            form_values[str(i) + '_avg'] = round((total / (number_params * 5) * 100) , 1) # calculate percentage
+
+
+    # calcualte for section 5
+    form_values['5_total'] = form_values[51] + form_values[52] + form_values[53] + form_values[54]
+    form_values['5_total2'] = form_values[55] + form_values[56] + form_values[57] + form_values[58] + form_values[59]
+
+    # if section 2 of 5 is N/A and left empty
+    if math.isnan(form_values['5_total2']):
+        form_values[55], form_values[56], form_values[57], form_values[58], form_values[59], form_values['5_total2'], form_values['5_avg2'] = "N/A", "N/A", "N/A", "N/A", "N/A", "N/A", "N/A"
+
+        # calculate document total without part 2 of section 5
+        total = form_values['1_total'] + form_values['2_total'] + form_values['3_total'] + form_values['4_total'] + form_values['5_total'] + form_values['6_total'] + 25
+    else:
+        # calculate document total with part 2 of section 5
+        total = form_values['1_total'] + form_values['2_total'] + form_values['3_total'] + form_values['4_total'] + form_values['5_total'] + form_values['5_total2'] + form_values['6_total']
+        form_values['5_avg2'] = round((form_values['5_total2'] / 25) * 100, 1)
+
+    form_values['5_avg'] = round((form_values['5_total'] / 20) * 100, 1)
+
+    # find total values
+    form_values['percentage'] = "Score: " + str(round(total / 34, 2)) + "/5 = " + str(round(total/1.7, 1)) + "%"
+    form_values['total'] = "Total: " + str(total) + "/170"
+
+    # add in strings for presentation on document
+    for i in range(1,7):
+        if i != 5:
+            number_params = sum(1 for key, _ in form_values.items() if isinstance(key, int) and key // 10 == i) # number of keys in section
+            form_values[str(i) + '_total'] = str(form_values[str(i) + '_total']) + "/" + str(number_params * 5)
+            form_values[str(i) + '_avg'] = str(form_values[str(i) + '_avg']) + "%"
+
+    # make strings for section 5
+    form_values['5_total'] = str(form_values['5_total']) + "/20"
+    form_values['5_avg'] = str(form_values['5_avg']) + "%"
+    if form_values['5_total2'] != 'N/A':
+        form_values['5_total2'] = str(form_values['5_total2']) + "/25"
+        form_values['5_avg2'] = str(form_values['5_avg2']) + "%"
+
+    return form_values
+
+def score_CANS(form_values:dict):
+    """
+    Counts CANS 'Y' answers in each group and calculates the CANS level, stored in form_values as 'total'.
+    """
+
+    # add in totals to dictionary
+    form_values['A_subtotal'] = 0
+    form_values['B_subtotal'] = 0
+    form_values['C_subtotal'] = 0
+    form_values['D_subtotal'] = 0
+
+    for question_no in range(1, 29):
+        if form_values[question_no].upper() == 'Y':
+
+            # add to totals
+            if question_no > 0 and question_no < 11:
+                form_values['A_subtotal'] += 1
+            elif question_no > 10 and question_no < 15:
+                form_values['B_subtotal'] += 1
+            elif question_no > 14 and question_no < 26:
+                form_values['C_subtotal'] += 1
+            elif question_no > 25 and question_no < 29:
+                form_values['D_subtotal'] += 1
+
+    # calculate total
+    form_values['subtotal'] = form_values['A_subtotal'] + form_values['B_subtotal'] + form_values['C_subtotal'] + form_values['D_subtotal']
+
+    # calculate CANS level
+    if form_values['A_subtotal'] < 4:
+        if form_values['B_subtotal'] >= 4:
+            form_values['total'] = 4.2
+        elif form_values['C_subtotal'] >= 4: # check C subtotal
+            form_values['total'] = 4.1
+        elif form_values['C_subtotal'] == 3 or form_values['D_subtotal'] == 3:
+            form_values['total'] = 3
+        elif form_values['C_subtotal'] == 2 or form_values['D_subtotal'] == 2:
+            form_values['total'] = 2
+        elif form_values['C_subtotal'] == 1 or form_values['D_subtotal'] == 1:
+            form_values['total'] = 1
+        else:
+            form_values['total'] = 0
+    elif form_values['A_subtotal'] == 4:
+        form_values['total'] = 4.3
+    elif form_values['A_subtotal'] == 5:
+        form_values['total'] = 5
+    elif form_values['A_subtotal'] == 6:
+        form_values['total'] = 6
+    else:
+        form_values['total'] = 7
+
+    return form_values
+
+def score_LSP(form_values:dict):
+    """
+    Calculates LSP subscale scores and totals and stores them in form_values.
+    """
+
+    # perform scoring
+    form_values['a_score'] = form_values[1] + form_values[2] + form_values[3] + form_values[8]
+    form_values['b_score'] = form_values[4] + form_values[5] + form_values[6] + form_values[9] + form_values[16]
+    form_values['c_score'] = form_values[10] + form_values[11] + form_values[12]
+    form_values['d_score'] = form_values[7] + form_values[13] + form_values[14] + form_values[15]
+
+    # total values and percentage
+    form_values['total'] = form_values['a_score'] + form_values['b_score'] + form_values['c_score'] + form_values['d_score']
+    form_values['total_100'] = str(round(form_values['total'] * 2.0833, 2)) + "/100"
+
+    # turn into strings for presentation
+    form_values['a_score'] = str(form_values['a_score']) + "/12"
+    form_values['b_score'] = str(form_values['b_score']) + "/15"
+    form_values['c_score'] = str(form_values['c_score']) + "/9"
+    form_values['d_score'] = str(form_values['d_score']) + "/12"
+
+    return form_values
+
+def score_LAWTON(form_values:dict):
+    """
+    Calculates LAWTON left, right and overall totals and stores them in form_values.
+    """
+
+    # calculate left side total
+    form_values['left_total'] = 0
+    if form_values['A'] != 4:
+        form_values['left_total'] += 1
+    if form_values['B'] == 1:
+        form_values['left_total'] += 1
+    if form_values['C'] == 1:
+        form_values['left_total'] += 1
+    if form_values['D'] != 5:
+        form_values['left_total'] += 1
+
+    # calcualte right side total
+    form_values['right_total'] = 0
+    if form_values['E'] != 3:
+        form_values['right_total'] += 1
+    if form_values['F'] <= 3:
+        form_values['right_total'] += 1
+    if form_values['G'] == 1:
+        form_values['right_total'] += 1
+    if form_values['H'] != 3:
+        form_values['right_total'] += 1
+
+    # calculate total
+    form_values['total'] = form_values['left_total'] + form_values['right_total']
+
+    return form_values
+
+def score_BBS(form_values:dict):
+    """
+    Calculates the BBS total score and stores it in form_values.
+    """
+
+    total = 0 # to increment for patient total score
+    for question_no in range(1, 15):
+        if form_values[question_no] in range(5): # only answers with a checkbox on the form count
+            total += int(form_values[question_no])
+
+    form_values['total'] = total
+
+    return form_values
+
+def score_LEFS(form_values:dict):
+    """
+    Calculates the LEFS total and the points scored in each column and stores them in form_values.
+    """
+
+    # track totals
+    form_values['total'] = 0
+    form_values['0_total'] = 0
+    form_values['1_total'] = 0
+    form_values['2_total'] = 0
+    form_values['3_total'] = 0
+    form_values['4_total'] = 0
+
+    for i in range(20):
+
+        # find score
+        score = form_values[i + 1]
+
+        # column totals are in points, not answers
+        if score == 1:
+            form_values['1_total'] += 1
+        elif score == 2:
+            form_values['2_total'] += 2
+        elif score == 3:
+            form_values['3_total'] += 3
+        elif score == 4:
+            form_values['4_total'] += 4
+        form_values['total'] += score # increment total score
+
+    return form_values
+
+def score_FRAT(form_values:dict):
+    """
+    Calculates the FRAT part 1 total and the falls risk status highlighted on the form and stores them in form_values.
+    """
+
+    # part 1 scores, recent falls uses a 2,4,6,8 scale and the rest 1-4
+    total = form_values['Recent Falls'] + form_values['Medications'] + form_values['Psychological'] + form_values['Cognitive Status']
+    form_values['total'] = total
+
+    # falls risk status, low 5-11, medium 12-15 and high 16-20 as printed on the form
+    if form_values['auto_high_1'] == 'Y' or form_values['auto_high_2'] == 'Y' or total >= 16:
+        form_values['risk_status'] = 'HIGH'
+    elif total >= 5 and total <= 11:
+        form_values['risk_status'] = 'LOW'
+    elif total >= 12 and total <= 15:
+        form_values['risk_status'] = 'MEDIUM'
+    else:
+        form_values['risk_status'] = ''
+
+    return form_values
+
+def score_HONOS(form_values:dict):
+    """
+    Calculates the HONOS total score and stores it in form_values.
+    """
+
+    total = 0 # track total score
+    for question_no in range(1, 13):
+        total += form_values[question_no] # increment total
+
+    # to add in total
+    form_values['total'] = str(total) + '/48'
+
+    return form_values
+
+def score_CASP(form_values:dict):
+    """
+    Calculates the CASP section summaries and total and stores them in form_values.
+    """
+
+    # total values
+    form_values['1_summary'] = 0
+    form_values['2_summary'] = 0
+    form_values['3_summary'] = 0
+    form_values['4_summary'] = 0
+
+    for question_no in range(1, 21):
+        value = form_values[question_no]
+
+        # calculate totals, only answers with a checkbox on the form count
+        if value in range(5):
+            if question_no >= 1 and question_no <= 6:
+                form_values['1_summary'] += int(value)
+            elif question_no >= 6 and question_no <= 10:
+                form_values['2_summary'] += int(value)
+            elif question_no >= 10 and question_no <= 15:
+                form_values['3_summary'] += int(value)
+            elif question_no >= 15 and question_no <= 20:
+                form_values['4_summary'] += int(value)
+
+    # form totals
+    total = form_values['1_summary'] + form_values['2_summary'] + form_values['3_summary'] + form_values['4_summary']
+    form_values['total'] = 'Total: ' + str(total) + '/80 = ' + str(round((total/80)*100, 2)) + '%'
+
+    # totals as full strings
+    form_values['1_summary'] = str(form_values['1_summary']) + '/24'
+    form_values['2_summary'] = str(form_values['2_summary']) + '/16'
+    form_values['3_summary'] = str(form_values['3_summary']) + '/20'
+    form_values['4_summary'] = str(form_values['4_summary']) + '/20'
+
+    return form_values
+
+def score_HONOSCA(form_values:dict):
+    """
+    Calculates the HoNOSCA section A and overall totals and stores them in form_values.
+    """
+
+    A_total = 0 # track A subtotal
+
+    for i in range(1, 14):
+        A_total += form_values[i]
+
+    total = A_total + form_values[14] + form_values[15]
+
+    form_values['total'] = total
+    form_values['A_total'] = A_total
+
+    return form_values
+
+def compute_scores(master:dict[dict]):
+    """
+    Calculates the scores of every form in the master dictionary without generating any documents.
+    Returns a dictionary of form name to the values calculated for it. The master dictionary is left unchanged.
+    """
+
+    scores = {}
+    for key in master.keys():
+        function_name = globals().get(f"score_{key}")
+        if key != 'GENERAL' and function_name:
+            form_values = function_name(dict(master[key])) # copy, scoring adds to the dictionary
+            scores[key] = {k: v for k, v in form_values.items() if k not in master[key] or v is not master[key][k]} # calculated and N/A values only
+
+    return scores
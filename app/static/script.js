@@ -1,5 +1,7 @@
 const fileInput = document.getElementById('file-input');
 const filePreview = document.getElementById('file-preview');
+const previewPanel = document.getElementById('preview-panel');
+const progressPanel = document.getElementById('progress-panel');
 let selectedFiles = [];
 
 // Function to update the file preview
@@ -12,6 +14,7 @@ function updateFilePreview() {
         fileItem.className = 'file-item';
         fileItem.innerHTML = `
             <span>${file.name}</span>
+            <button class="preview-btn" data-index="${index}">Preview</button>
             <button class="remove-btn" data-index="${index}">X</button>
         `;
         filePreview.appendChild(fileItem);
@@ -24,11 +27,64 @@ function updateFilePreview() {
             removeFile(index);
         });
     });
+
+    // Add event listeners to all "preview" buttons
+    document.querySelectorAll('.preview-btn').forEach(btn => {
+        btn.addEventListener('click', function() {
+            const index = this.getAttribute('data-index');
+            showPreview(selectedFiles[index]);
+        });
+    });
+}
+
+// Function to show thumbnails of the forms generated from a single file
+function showPreview(file) {
+    const formData = new FormData();
+    formData.append('file', file);
+
+    previewPanel.innerHTML = '<p>Loading preview...</p>';
+    previewPanel.style.display = 'block';
+
+    fetch('/preview', {
+        method: 'POST',
+        body: formData
+    })
+    .then(response => response.json().then(data => ({ ok: response.ok, data: data })))
+    .then(({ ok, data }) => {
+        if (!ok) {
+            previewPanel.style.display = 'none';
+            let errorMessage = "";
+            for (const [filename, messages] of Object.entries(data.errors)) {
+                errorMessage += `Errors in ${filename}:\n${messages.join('\n')}\n`;
+            }
+            alert(errorMessage);
+            return;
+        }
+
+        previewPanel.innerHTML = `<h2>Preview of ${file.name}</h2>`;
+
+        // images load lazily so only pages scrolled into view are rendered
+        data.forms.forEach(form => {
+            for (let page = 0; page < form.pages; page++) {
+                const img = document.createElement('img');
+                img.className = 'preview-page';
+                img.loading = 'lazy';
+                img.alt = `${form.name} page ${page + 1}`;
+                img.src = `/preview/${data.id}/${form.name}/${page}.png`;
+                previewPanel.appendChild(img);
+            }
+        });
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        previewPanel.style.display = 'none';
+    });
 }
 
 // Function to remove a file from the selected list
 function removeFile(index) {
     selectedFiles.splice(index, 1);  // Remove the file
+    previewPanel.style.display = 'none';  // Preview may belong to the removed file
     updateFilePreview();  // Update the preview
 }
 
@@ -44,40 +100,157 @@ fileInput.addEventListener('change', function() {
     updateFilePreview();  // Update the preview
 });
 
+const MAX_ATTEMPTS = 3;  // tries per file before giving up on it after network or server errors
+const MAX_BUSY_WAIT = 600;  // seconds a file keeps waiting while the server is busy before giving up on it
+const FILES_IN_FLIGHT = 2;  // files sent at once, so one file renders while the next uploads, if the server can render that many
+
+// Function to wait before retrying
+function sleep(seconds) {
+    return new Promise(resolve => setTimeout(resolve, seconds * 1000));
+}
+
+// Function to send one file of a batch, retrying on its own if the network or server fails
+async function sendFile(batchId, file) {
+    let busyWait = 0;
+    for (let attempt = 1; ; attempt++) {
+        const formData = new FormData();
+        formData.append('files[]', file);
+
+        let response;
+        try {
+            response = await fetch(`/batch/${batchId}/files`, { method: 'POST', body: formData });
+        } catch (error) {
+            if (attempt >= MAX_ATTEMPTS) {
+                return { [file.name]: ['The file could not be sent. Please check your connection and try again.'] };
+            }
+            await sleep(2 ** attempt);  // network blip, back off and resend only this file
+            continue;
+        }
+
+        if (response.ok) {
+            return null;
+        }
+        if (response.status === 400 || response.status === 413) {
+            return (await response.json()).errors;  // problem with the file itself or too many files, resending won't help
+        }
+        if ((response.status === 503 || response.status === 429) && busyWait < MAX_BUSY_WAIT) {
+            const wait = Number(response.headers.get('Retry-After')) || 10;
+            busyWait += wait;
+            attempt--;  // busy isn't a failure, wait as asked without using up an attempt
+            await sleep(wait);
+            continue;
+        }
+        if (attempt >= MAX_ATTEMPTS || busyWait >= MAX_BUSY_WAIT) {
+            const data = await response.json().catch(() => null);
+            return data && data.errors ? data.errors : { [file.name]: ['The server could not process the file. Please try again.'] };
+        }
+        await sleep(2 ** attempt);  // server error, back off and resend only this file
+    }
+}
+
+// Function to show errors from a response in an alert
+function alertErrors(errors) {
+    let errorMessage = "";
+    for (const [filename, messages] of Object.entries(errors)) {
+        errorMessage += `Errors in ${filename}:\n${messages.join('\n')}\n`;
+    }
+    alert(errorMessage);
+}
+
+// Function to show each file's progress through a batch, returns a function that stops following it
+function followProgress(batch) {
+    progressPanel.innerHTML = '';
+    const rows = {};
+
+    function showEvent(event) {
+        const name = event.file || 'Zip file';
+        if (!rows[name]) {
+            rows[name] = document.createElement('div');
+            rows[name].className = 'progress-file';
+            rows[name].innerHTML = `<strong></strong> <span class="progress-status"></span><div class="progress-stages"></div>`;
+            rows[name].querySelector('strong').textContent = name;
+            progressPanel.appendChild(rows[name]);
+        }
+
+        const label = event.form ? `${event.form} ${event.stage}` : event.stage;
+        rows[name].querySelector('.progress-status').textContent = `- ${label}`;
+        if (event.seconds !== undefined) {
+            const stage = document.createElement('span');
+            stage.textContent = `${label} ${event.seconds.toFixed(2)}s · `;
+            rows[name].querySelector('.progress-stages').appendChild(stage);
+        }
+    }
+
+    // stream events where the server can hold the connection open, otherwise poll for them
+    if (batch.stream) {
+        const source = new EventSource(`/batch/${batch.id}/events`);
+        source.onmessage = message => showEvent(JSON.parse(message.data));
+        return () => source.close();
+    }
+
+    let following = true;
+    let after = 0;
+    (async function poll() {
+        while (following) {
+            try {
+                const data = await fetch(`/batch/${batch.id}/events?after=${after}`).then(response => response.json());
+                data.events.forEach(showEvent);
+                after = data.next;
+            } catch (error) {
+                console.error('Error:', error);  // progress is only informational, keep uploading
+            }
+            await sleep(1);
+        }
+    })();
+    return () => { following = false; };
+}
+
 // Handling the form submission
-document.getElementById('upload-form').addEventListener('submit', function(event) {
+document.getElementById('upload-form').addEventListener('submit', async function(event) {
     event.preventDefault();  // Prevent the form from submitting the default way
 
-    const formData = new FormData();  // Create a FormData object
-
-    // Add only the files in `selectedFiles` to the FormData
-    selectedFiles.forEach(file => formData.append('files[]', file));
+    let stopProgress = () => {};
 
     const loadingIndicator = document.getElementById('loading-indicator');
     loadingIndicator.style.display = 'block';  // Show loading indicator
 
-    fetch('/upload', {
-        method: 'POST',
-        body: formData
-    })
-    .then(response => {
+    try {
+        // each file is sent and processed on its own under one batch
+        const batch = await fetch('/batch', { method: 'POST' }).then(response => response.json());
+        stopProgress = followProgress(batch);
+
+        const files = [...selectedFiles];
+        const errors = {};
+        let next = 0;
+        async function sendNext() {
+            while (next < files.length) {
+                const file = files[next++];
+                Object.assign(errors, await sendFile(batch.id, file));
+            }
+        }
+        // no more files at once than the server can render, or they would take each other's render slots
+        const lanes = Math.max(1, Math.min(FILES_IN_FLIGHT, batch.files_in_flight || 1));
+        await Promise.all(Array.from({ length: lanes }, sendNext));
+
+        if (Object.keys(errors).length > 0) {
+            loadingIndicator.style.display = 'none';  // Hide loading indicator on error
+            alertErrors(errors);
+            return;
+        }
+
+        // the zip is assembled from the files already processed
+        const response = await fetch(`/batch/${batch.id}/finish`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ files: files.map(file => file.name) })
+        });
         if (!response.ok) {
-            return response.json().then(err => {
-                // Hide loading indicator on error
-                loadingIndicator.style.display = 'none'; 
-                
-                // Construct error messages from the dictionary
-                let errorMessage = "";
-                for (const [filename, messages] of Object.entries(err.errors)) {
-                    errorMessage += `Errors in ${filename}:\n${messages.join('\n')}\n`;
-                }
-                // Show alert with error messages
-                alert(errorMessage);
-            });
+            loadingIndicator.style.display = 'none';
+            alertErrors((await response.json()).errors);
+            return;
         }
-        return response.blob();  // Handle success
-    })
-    .then(blob => {
+        const blob = await response.blob();
+
         // Create a link element to download the zip file
         const url = window.URL.createObjectURL(blob);
         const a = document.createElement('a');
@@ -86,19 +259,19 @@ document.getElementById('upload-form').addEventListener('submit', function(event
         document.body.appendChild(a);
         a.click();
         a.remove();
-        
+
         // clear queue
         fileInput.value = '';
         selectedFiles = [];
         updateFilePreview();
-        
-        
+
         loadingIndicator.style.display = 'none';  // Hide loading indicator after download
-    })
-    .catch(error => {
+    } catch (error) {
         console.error('Error:', error);
         loadingIndicator.style.display = 'none';  // Hide loading indicator on fetch error
-    });
+    } finally {
+        stopProgress();
+    }
 });
 
 // Toggle visibility of form links
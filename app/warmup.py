@@ -0,0 +1,66 @@
+import logging
+import os
+import sys
+import time
+
+STARTUP_BUDGET = float(os.getenv("STARTUP_BUDGET", 5)) # seconds a process may take to import and warm up before a warning is logged
+
+logger = logging.getLogger(__name__)
+
+def warm_text_locations(main):
+    """
+    Searches the blank HONOS and LAWTON templates for every option they can highlight, filling main.text_locations.
+    """
+    import fitz
+
+    searches = [] # (template, string, case sensitive)
+    for response in main.read_lines('forms/honos.txt'):
+        for option in response.split('_'):
+            searches += [('forms/HONOS.pdf', line, False) for line in option.split('*')]
+    for lines in main.HONOS_PROBLEMS.values():
+        searches += [('forms/HONOS.pdf', line, True) for line in lines]
+    for row in main.read_lines('forms/lawton.txt'):
+        for option in row.split('/'):
+            searches += [('forms/LAWTON.pdf', line, False) for line in option.split('*')]
+
+    templates = {}
+    for path, string, case_sensitive in searches:
+        if path not in templates:
+            templates[path] = fitz.open(path)
+        for page in templates[path]:
+            main.find_text(page, string, case_sensitive)
+
+    return len(searches)
+
+def warm_up():
+    """
+    Imports the app and fills its caches so the first request runs at full speed. Returns the time taken by each step.
+    Called before gunicorn forks workers, and at the start of processes that generate documents.
+    """
+    timings = {}
+
+    if "main" not in sys.modules: # already imported when gunicorn preloads the app
+        start = time.perf_counter()
+        import main # pandas, fitz and Flask, most of the startup time
+        timings["import"] = time.perf_counter() - start
+    import main
+
+    start = time.perf_counter()
+    warm_text_locations(main)
+    timings["text locations"] = time.perf_counter() - start
+
+    for form_name in main.FORM_FILES.values(): # page counts listed by /preview
+        main.template_page_count(form_name.replace('.pdf', ''))
+
+    return timings
+
+def startup_report(timings:dict, log=logger):
+    """
+    Logs how long each startup step took, with a warning if the total went over STARTUP_BUDGET.
+    """
+    total = sum(timings.values())
+    steps = ", ".join(f"{step} {seconds:.2f}s" for step, seconds in timings.items())
+    if total > STARTUP_BUDGET:
+        log.warning("Startup took %.2fs, over the %gs budget (%s)", total, STARTUP_BUDGET, steps)
+    else:
+        log.info("Startup took %.2fs (%s)", total, steps)
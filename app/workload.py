@@ -0,0 +1,100 @@
+from datetime import datetime
+import json
+import math
+import os
+import random
+import threading
+import time
+
+WORKLOAD_CAPTURE_DIR = os.getenv("WORKLOAD_CAPTURE_DIR") # capture is off unless set
+WORKLOAD_SAMPLE_RATE = float(os.getenv("WORKLOAD_SAMPLE_RATE", 1)) # fraction of uploads captured
+
+# GENERAL entries that identify the patient or assessor
+IDENTIFIERS = ['patient_first_name', 'patient_surname', 'patient_name', 'assessor_name']
+
+# free text entries in forms, which may also identify the patient
+FREE_TEXT = {'CANS': ['A_desc', 'B_desc', 'C_desc', 'D_desc'], 'HONOS': ['comment8'], 'FRAT': ['Other_desc']}
+
+_write_lock = threading.Lock()
+
+def capture_enabled():
+    """
+    Decides whether the current upload is captured.
+    """
+    return bool(WORKLOAD_CAPTURE_DIR) and random.random() < WORKLOAD_SAMPLE_RATE
+
+def scrub(master:dict):
+    """
+    Returns a copy of the master dictionary with identifying entries replaced.
+    Text is replaced by X's of the same length so the filled forms take the same space, the date of birth is dropped,
+    age is rounded down to a 5 year band and the assessment date to the first of the month.
+    """
+    scrubbed = {name: dict(values) for name, values in master.items()}
+    general = scrubbed['GENERAL']
+
+    for key in IDENTIFIERS:
+        if key in general:
+            general[key] = 'X' * len(str(general[key]))
+    if 'DOB' in general:
+        general['DOB'] = ''
+    if general.get('date'):
+        general['date'] = '01' + general['date'][2:] # assessment date kept to the month, DD/MM/YY
+    if isinstance(general.get('age'), int):
+        general['age'] = general['age'] - general['age'] % 5
+
+    for name, keys in FREE_TEXT.items():
+        for key in keys:
+            if isinstance(scrubbed.get(name, {}).get(key), str):
+                scrubbed[name][key] = 'X' * len(scrubbed[name][key])
+
+    return scrubbed
+
+def encode_master(master:dict):
+    """
+    Converts a master dictionary to JSON-safe form. Entries are stored as [key, value] pairs so integer keys survive, and NaN becomes null.
+    """
+    return {name: [[key, None if isinstance(value, float) and math.isnan(value) else value] for key, value in values.items()]
+            for name, values in master.items()}
+
+def decode_master(encoded:dict):
+    """
+    Reverses encode_master, giving a master dictionary as produced by read_excel and validate_columns.
+    """
+    return {name: {key: math.nan if value is None else value for key, value in pairs} for name, pairs in encoded.items()}
+
+def file_size(file):
+    """
+    Size in bytes of an uploaded file, leaving its stream position unchanged.
+    """
+    position = file.stream.tell()
+    file.stream.seek(0, os.SEEK_END)
+    size = file.stream.tell()
+    file.stream.seek(position)
+    return size
+
+def capture_file(file, master=None, errors=None):
+    """
+    Describes one uploaded file for the workload record. Only the scrubbed master dictionary of a valid file is kept, never the file name.
+    """
+    if master is None:
+        status = "unreadable"
+    elif errors:
+        status = "invalid"
+    else:
+        status = "ok"
+
+    captured = {"size": file_size(file), "status": status}
+    if status == "ok":
+        captured["master"] = encode_master(scrub(master))
+    return captured
+
+def record_upload(files:list, elapsed:float, status:int):
+    """
+    Appends one upload to the day's workload file in WORKLOAD_CAPTURE_DIR as a line of JSON.
+    """
+    entry = {"time": time.time(), "elapsed": elapsed, "status": status, "files": files}
+    path = os.path.join(WORKLOAD_CAPTURE_DIR, f"workload-{datetime.now().strftime('%Y%m%d')}.jsonl")
+
+    os.makedirs(WORKLOAD_CAPTURE_DIR, exist_ok=True)
+    with _write_lock, open(path, "a") as file:
+        file.write(json.dumps(entry, default=str) + "\n") # one write per line so workers don't interleave
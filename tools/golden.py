@@ -0,0 +1,241 @@
+"""
+Checks that a fast rendering mode produces the same documents as the reference pipeline.
+
+A corpus of synthetic workbooks (or a directory of real ones) is run through the reference
+pipeline and through a candidate mode. For every form the page rasters are compared with a
+perceptual tolerance, and the filled field values and computed scores must match exactly.
+Differing pages are written out as reference/candidate/diff images. The candidate passes
+only if every form is equivalent and it is at least --min-speedup times faster.
+
+A candidate is a dictionary of replacement functions for main.py, for example
+{'render_to_image': fast_render}. Built-in candidates are listed in CANDIDATES, others can be
+loaded with --candidate module:attribute.
+
+Usage:
+    python tools/golden.py --candidate zoom1 --count 20 --output golden_report
+"""
+
+import argparse
+import contextlib
+from functools import partial
+import glob
+import importlib
+import io
+import json
+import os
+import sys
+import time
+from unittest import mock
+
+import fitz
+import numpy as np
+
+from synthetic import ROOT, make_workbook
+
+APP_DIR = os.path.join(ROOT, 'app')
+START_DIR = os.getcwd() # paths given on the command line are relative to where the tool was started
+sys.path.insert(0, APP_DIR)
+os.chdir(APP_DIR) # main.py opens forms relative to the app directory
+
+import main # noqa: E402
+
+CANDIDATES = {
+    'reference': {},
+    'zoom1': {'render_to_image': partial(main.render_to_image, zoom=1)}, # half resolution rasters
+}
+
+
+def load_candidate(name:str):
+    """
+    Returns the overrides of a built-in candidate, or of one given as module:attribute.
+    """
+
+    if name in CANDIDATES:
+        return CANDIDATES[name]
+
+    module_name, _, attribute = name.partition(':')
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def field_values(document):
+    """
+    Returns the value of every form field in document, keyed by page number and field name.
+    """
+
+    return {f'{page.number}/{field.field_name}': field.field_value for page in document for field in page.widgets()}
+
+
+def run_pipeline(data:bytes, overrides:dict):
+    """
+    Runs a workbook through the pipeline in main.py with overrides applied.
+    Returns the per-form results and the time spent filling and rendering.
+    """
+
+    with mock.patch.multiple(main, **overrides) if overrides else contextlib.nullcontext():
+        master = main.read_excel(io.BytesIO(data))
+        main.validate_columns(master, '') # also blanks optional entries, as in /upload
+        results = {}
+        elapsed = 0
+
+        for key in master.keys():
+            function_name = getattr(main, f'fill_{key}', None)
+            if key == 'GENERAL' or not function_name:
+                continue
+
+            start = time.perf_counter()
+            filled_form = function_name(master['GENERAL'], master[key])
+            fields = field_values(filled_form) # read before rendering, outside the timed section
+            elapsed += time.perf_counter() - start
+
+            start = time.perf_counter()
+            rendered = main.render_to_image(filled_form)
+            elapsed += time.perf_counter() - start
+
+            scores = {str(k): str(v) for k, v in master[key].items()} # fill functions store computed scores in form_values
+            results[key] = {'fields': fields, 'scores': scores, 'document': rendered}
+
+    return results, elapsed
+
+
+def rasterize(document, dpi:int):
+    """
+    Returns each page of document as a greyscale array at dpi.
+    """
+
+    pages = []
+    for page in document:
+        pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+        pages.append(np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width))
+    return pages
+
+
+def save_image(array, path:str):
+    """
+    Writes a greyscale or RGB array to a PNG file.
+    """
+
+    colorspace = fitz.csGRAY if array.ndim == 2 else fitz.csRGB
+    fitz.Pixmap(colorspace, array.shape[1], array.shape[0], np.ascontiguousarray(array).tobytes(), 0).save(path)
+
+
+def compare_documents(reference, candidate, args, prefix:str):
+    """
+    Compares the page rasters of two documents and returns a list of differences.
+    Pages outside the tolerance are written to the output directory.
+    """
+
+    # both documents are rasterized at the same dpi, so differing render resolutions compare like for like
+    reference_pages = rasterize(reference, args.dpi)
+    candidate_pages = rasterize(candidate, args.dpi)
+
+    if len(reference_pages) != len(candidate_pages):
+        return [f'{len(reference_pages)} pages in reference, {len(candidate_pages)} in candidate']
+
+    differences = []
+    for number, (expected, actual) in enumerate(zip(reference_pages, candidate_pages)):
+        if expected.shape != actual.shape:
+            differences.append(f'page {number}: size {expected.shape} in reference, {actual.shape} in candidate')
+            continue
+
+        delta = np.abs(expected.astype(np.int16) - actual.astype(np.int16))
+        mean = delta.mean()
+        changed = (delta > args.pixel_threshold).mean() # fraction of visibly different pixels
+
+        if mean > args.max_mean or changed > args.max_changed:
+            differences.append(f'page {number}: mean difference {mean:.2f}, {changed:.2%} of pixels changed')
+
+            # diff image shows the reference faded with changed pixels in red
+            diff = np.stack([expected // 2 + 127] * 3, axis=-1)
+            diff[delta > args.pixel_threshold] = [255, 0, 0]
+
+            os.makedirs(args.output, exist_ok=True)
+            save_image(expected, os.path.join(args.output, f'{prefix}_p{number}_reference.png'))
+            save_image(actual, os.path.join(args.output, f'{prefix}_p{number}_candidate.png'))
+            save_image(diff, os.path.join(args.output, f'{prefix}_p{number}_diff.png'))
+
+    return differences
+
+
+def compare_values(expected:dict, actual:dict, label:str):
+    """
+    Returns a list of keys whose values differ between two dictionaries.
+    """
+
+    return [f'{label} {key}: {expected.get(key)!r} in reference, {actual.get(key)!r} in candidate'
+            for key in sorted(set(expected) | set(actual)) if expected.get(key) != actual.get(key)]
+
+
+def load_corpus(args):
+    """
+    Returns (name, bytes) for each workbook in --corpus, or synthetic workbooks if no corpus is given.
+    """
+
+    if args.corpus:
+        corpus = []
+        for path in sorted(glob.glob(os.path.join(START_DIR, args.corpus, '*.xlsx'))):
+            with open(path, 'rb') as file:
+                corpus.append((os.path.basename(path), file.read()))
+        return corpus
+
+    return [(f'synthetic_{seed}', make_workbook(seed)) for seed in range(args.seed, args.seed + args.count)]
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--candidate', default='zoom1', help='built-in candidate name or module:attribute')
+    parser.add_argument('--corpus', help='directory of .xlsx workbooks, synthetic workbooks are used if not given')
+    parser.add_argument('--count', type=int, default=10, help='number of synthetic workbooks')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dpi', type=int, default=50, help='resolution the pages are compared at')
+    parser.add_argument('--pixel-threshold', type=int, default=64, help='grey level difference counted as a changed pixel')
+    parser.add_argument('--max-mean', type=float, default=2.0, help='highest allowed mean grey level difference per page')
+    parser.add_argument('--max-changed', type=float, default=0.005, help='highest allowed fraction of changed pixels per page')
+    parser.add_argument('--min-speedup', type=float, default=1.0, help='lowest reference/candidate time ratio that passes')
+    parser.add_argument('--output', default='golden_report', help='directory for diff images and report.json')
+    args = parser.parse_args()
+    args.output = os.path.join(START_DIR, args.output)
+
+    overrides = load_candidate(args.candidate)
+    reference_time = candidate_time = 0
+    report = {'candidate': args.candidate, 'workbooks': {}}
+
+    for name, data in load_corpus(args):
+        reference, elapsed = run_pipeline(data, CANDIDATES['reference'])
+        reference_time += elapsed
+        candidate, elapsed = run_pipeline(data, overrides)
+        candidate_time += elapsed
+
+        differences = {}
+        for form in sorted(set(reference) | set(candidate)):
+            if form not in reference or form not in candidate:
+                differences[form] = ['form only produced by one pipeline']
+                continue
+
+            found = compare_values(reference[form]['fields'], candidate[form]['fields'], 'field')
+            found += compare_values(reference[form]['scores'], candidate[form]['scores'], 'score')
+            found += compare_documents(reference[form]['document'], candidate[form]['document'], args, f'{name}_{form}')
+            if found:
+                differences[form] = found
+
+        report['workbooks'][name] = differences
+        print(f"{name}: {'equivalent' if not differences else 'DIFFERENT'}", flush=True)
+        for form, found in differences.items():
+            for difference in found:
+                print(f'    {form} {difference}')
+
+    speedup = reference_time / candidate_time if candidate_time else float('inf')
+    equivalent = not any(report['workbooks'].values())
+    report.update({'reference_seconds': reference_time, 'candidate_seconds': candidate_time,
+                   'speedup': speedup, 'equivalent': equivalent, 'passed': equivalent and speedup >= args.min_speedup})
+
+    os.makedirs(args.output, exist_ok=True)
+    with open(os.path.join(args.output, 'report.json'), 'w') as file:
+        json.dump(report, file, indent=2)
+
+    print(f"reference {reference_time:.2f}s, candidate {candidate_time:.2f}s, speed ratio {speedup:.2f}x")
+    print('PASS' if report['passed'] else 'FAIL')
+    sys.exit(0 if report['passed'] else 1)
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,277 @@
+"""
+Load tests /upload under a matrix of local gunicorn configurations.
+
+For each combination of worker count, worker class and threads, gunicorn is started on a local port
+with the output cache off, so every upload is rendered. Every simulated clinician logs in and posts
+synthetic workbooks to /upload concurrently, and throughput, latency percentiles, error rate and the
+peak RSS of each worker are reported. Workbooks are generated in sandbox processes below each worker,
+so their combined peak RSS is reported next to the worker's.
+
+Usage:
+    python tools/loadtest.py --workers 1,2,4 --worker-class sync,gthread --threads 1,4 --concurrency 8 --requests 40
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import http.cookiejar
+import json
+import math
+import os
+import secrets
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+
+from synthetic import ROOT, make_workbook
+
+APP_DIR = os.path.join(ROOT, 'app')
+
+
+def encode_files(files:list):
+    """
+    Encodes a list of (filename, bytes) as a multipart/form-data body under the files[] field.
+    Returns the body and its content type.
+    """
+
+    boundary = uuid.uuid4().hex
+    body = b''
+    for filename, data in files:
+        body += (f'--{boundary}\r\n'
+                 f'Content-Disposition: form-data; name="files[]"; filename="{filename}"\r\n'
+                 'Content-Type: application/vnd.openxmlformats-officedocument.spreadsheetml.sheet\r\n\r\n').encode()
+        body += data + b'\r\n'
+    body += f'--{boundary}--\r\n'.encode()
+
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+def login(base_url:str, password:str):
+    """
+    Logs in a new simulated clinician and returns an opener holding their session cookie.
+    """
+
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    data = urllib.parse.urlencode({'password': password}).encode()
+    opener.open(f'{base_url}/login', data=data, timeout=30).read()
+
+    return opener
+
+
+def worker_processes(master_pid:int):
+    """
+    Returns the pids of the processes forked by the gunicorn master, each mapped to the pids of all its descendants,
+    such as its workbook sandbox forkserver and the processes that forks.
+    """
+
+    children = {} # parent pid -> child pids
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as file:
+                fields = file.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue # process exited while listing
+        children.setdefault(int(fields[1]), []).append(int(entry))
+
+    workers = {}
+    for worker in children.get(master_pid, []):
+        descendants = []
+        pending = list(children.get(worker, []))
+        while pending:
+            pid = pending.pop()
+            descendants.append(pid)
+            pending.extend(children.get(pid, []))
+        workers[worker] = descendants
+
+    return workers
+
+
+def rss_mb(pid:int):
+    """
+    Returns the resident set size of a process in MB, or 0 if it has exited.
+    """
+
+    try:
+        with open(f'/proc/{pid}/status') as file:
+            for line in file:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0
+
+
+def percentile(values:list, pct:float):
+    """
+    Returns the pct percentile of values using the nearest-rank method.
+    """
+
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    rank = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+def start_server(port:int, workers:int, worker_class:str, threads:int, password:str):
+    """
+    Starts gunicorn serving the app on port and waits until it accepts requests.
+    """
+
+    # a server left on the port would answer instead of the one being measured
+    with socket.socket() as probe:
+        if probe.connect_ex(('127.0.0.1', port)) == 0:
+            raise RuntimeError(f'port {port} is already in use')
+
+    # rendering is measured, so the same bodies sent again must not be answered from the output cache
+    env = dict(os.environ, FORM_CREATOR_PASSWORD=password, OUTPUT_CACHE_MB='0')
+    command = [sys.executable, '-m', 'gunicorn', 'main:app', '--bind', f'127.0.0.1:{port}',
+               '--workers', str(workers), '--worker-class', worker_class, '--threads', str(threads), '--timeout', '300']
+    server = subprocess.Popen(command, cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f'gunicorn exited with code {server.returncode}: {" ".join(command)}')
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/login', timeout=5).read()
+            return server
+        except OSError: # refused, reset or timed out while workers boot
+            time.sleep(0.2)
+
+    server.kill()
+    raise RuntimeError('gunicorn did not start within 60 seconds')
+
+
+def stop_server(server):
+    """
+    Stops gunicorn gracefully, killing it if it does not exit.
+    """
+
+    server.send_signal(signal.SIGTERM)
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+def run_config(args, workers:int, worker_class:str, threads:int, bodies:list):
+    """
+    Runs the load test against one gunicorn configuration and returns its results.
+    """
+
+    password = secrets.token_hex(8)
+    base_url = f'http://127.0.0.1:{args.port}'
+    server = start_server(args.port, workers, worker_class, threads, password)
+
+    peak_rss = {} # worker pid -> highest RSS seen
+    peak_sandbox_rss = {} # worker pid -> highest combined RSS of its descendants seen at once
+    done = threading.Event()
+
+    def sample_rss():
+        while not done.is_set():
+            for pid, descendants in worker_processes(server.pid).items():
+                peak_rss[pid] = max(peak_rss.get(pid, 0), rss_mb(pid))
+                peak_sandbox_rss[pid] = max(peak_sandbox_rss.get(pid, 0), sum(rss_mb(child) for child in descendants))
+            done.wait(0.25)
+
+    sampler = threading.Thread(target=sample_rss, daemon=True)
+    sampler.start()
+
+    clients = threading.local() # one logged in session per client thread
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def send(i:int):
+        nonlocal errors
+        if not hasattr(clients, 'opener'):
+            clients.opener = login(base_url, password)
+
+        body, content_type = bodies[i % len(bodies)]
+        request = urllib.request.Request(f'{base_url}/upload', data=body, headers={'Content-Type': content_type})
+        start = time.perf_counter()
+        try:
+            with clients.opener.open(request, timeout=args.timeout) as response:
+                response.read()
+                ok = response.status == 200
+        except OSError: # error status, refused connection or timeout
+            ok = False
+        elapsed = time.perf_counter() - start
+
+        with lock:
+            latencies.append(elapsed)
+            errors += not ok
+
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(send, range(args.requests)))
+        duration = time.perf_counter() - start
+    finally:
+        done.set()
+        sampler.join()
+        stop_server(server)
+
+    return {
+        'workers': workers,
+        'worker_class': worker_class,
+        'threads': threads,
+        'requests': len(latencies),
+        'rps': len(latencies) / duration,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'error_rate': errors / len(latencies),
+        'worker_rss_mb': [round(peak_rss[pid], 1) for pid in sorted(peak_rss)],
+        'sandbox_rss_mb': [round(peak_sandbox_rss[pid], 1) for pid in sorted(peak_rss)], # in the same order as the workers
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', default='1,2,4', help='comma separated worker counts')
+    parser.add_argument('--worker-class', default='sync,gthread', help='comma separated gunicorn worker classes')
+    parser.add_argument('--threads', default='1,4', help='comma separated thread counts')
+    parser.add_argument('--concurrency', type=int, default=8, help='number of simulated clinicians')
+    parser.add_argument('--requests', type=int, default=40, help='uploads sent per configuration')
+    parser.add_argument('--files', type=int, default=1, help='workbooks per upload')
+    parser.add_argument('--port', type=int, default=8050)
+    parser.add_argument('--timeout', type=float, default=300, help='per request timeout in seconds')
+    parser.add_argument('--json', help='also write results to this file')
+    args = parser.parse_args()
+
+    # a few distinct request bodies so workbooks vary between uploads
+    bodies = []
+    for i in range(max(1, min(args.requests, 8))):
+        files = [(f'synthetic_{i}_{j}.xlsx', make_workbook(i * args.files + j)) for j in range(args.files)]
+        bodies.append(encode_files(files))
+
+    results = []
+    print(f"{'workers':>7} {'class':>8} {'threads':>7} {'req/s':>7} {'p50':>7} {'p95':>7} {'p99':>7} {'errors':>7}  worker+sandbox RSS (MB)")
+    for worker_class in args.worker_class.split(','):
+        for threads in [int(t) for t in args.threads.split(',')]:
+            if worker_class == 'sync' and threads > 1:
+                continue # gunicorn switches sync workers with threads to gthread
+            for workers in [int(w) for w in args.workers.split(',')]:
+                result = run_config(args, workers, worker_class, threads, bodies)
+                results.append(result)
+                rss = ' '.join(f'{worker:.0f}+{sandbox:.0f}' for worker, sandbox in zip(result['worker_rss_mb'], result['sandbox_rss_mb']))
+                print(f"{workers:>7} {worker_class:>8} {threads:>7} {result['rps']:>7.2f} {result['p50']:>7.2f} {result['p95']:>7.2f} "
+                      f"{result['p99']:>7.2f} {result['error_rate']:>7.1%}  {rss}", flush=True)
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
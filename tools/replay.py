@@ -0,0 +1,191 @@
+"""
+Replays a captured workload through the pipeline or against a running app.
+
+Uploads recorded with WORKLOAD_CAPTURE_DIR set are replayed in their original order. With
+--speed 1 they are sent with their original spacing, --speed 10 ten times faster, and
+--speed 0 as fast as possible. Files that failed to read or validate were captured without
+their contents, so only valid files are replayed.
+
+In pipeline mode each upload's workbooks go straight to produce_output in this process, one
+at a time. In http mode each upload is rebuilt as workbooks from template.xlsx and posted to
+/upload of a running app, with up to --concurrency uploads in flight. Each posted workbook is made
+unique, so repeated uploads are rendered again rather than served from the app's output cache.
+
+Usage:
+    python tools/replay.py CAPTURE_DIR --mode pipeline
+    python tools/replay.py CAPTURE_DIR --mode http --url http://127.0.0.1:5000 --password secret --speed 5
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import glob
+import io
+import json
+import math
+import os
+import sys
+import threading
+import time
+import urllib.request
+import uuid
+
+from loadtest import encode_files, login, percentile
+from synthetic import ROOT, write_workbook
+
+APP_DIR = os.path.join(ROOT, 'app')
+sys.path.insert(0, APP_DIR)
+
+from workload import decode_master # noqa: E402
+
+
+def load_workload(capture_dir:str):
+    """
+    Returns the captured uploads in capture_dir ordered by time, with the master dictionaries of their valid files decoded.
+    """
+
+    uploads = []
+    for path in glob.glob(os.path.join(capture_dir, 'workload-*.jsonl')):
+        with open(path) as file:
+            for line in file:
+                entry = json.loads(line)
+                entry['masters'] = [decode_master(f['master']) for f in entry['files'] if 'master' in f]
+                uploads.append(entry)
+
+    return sorted(uploads, key=lambda entry: entry['time'])
+
+
+def workbook_values(master:dict):
+    """
+    Converts a master dictionary back into template answers for write_workbook.
+    """
+
+    values = {}
+    for name, answers in master.items():
+        # blank optional entries and N/A answers were empty cells in the original workbook
+        values[name] = {key: None if value == '' or (isinstance(value, float) and math.isnan(value)) else value
+                        for key, value in answers.items()}
+
+    general = values['GENERAL']
+    if general.get('date'):
+        general['date'] = datetime.strptime(general['date'], '%d/%m/%y') # read_excel formats dates as DD/MM/YY
+    if isinstance(general.get('age'), int):
+        general['DOB'] = datetime(datetime.today().year - general['age'], 1, 1) # captures keep the age band, not the date of birth
+
+    return values
+
+
+def replay_pipeline(upload:dict, zoom:float):
+    """
+    Runs the valid files of an upload through produce_output and saves them, as /upload does.
+    """
+
+    import main
+
+    for master in upload['masters']:
+        document = main.produce_output(master, zoom)
+        document.save(io.BytesIO())
+    return True
+
+
+def replay_http(upload:dict, args, clients):
+    """
+    Posts the valid files of an upload to /upload. Returns whether the app responded with the zip file.
+    """
+
+    if not hasattr(clients, 'opener'):
+        clients.opener = login(args.url, args.password)
+
+    # each posted workbook is unique, so the app renders it rather than returning an earlier replay's PDF from its cache
+    files = [(f'replay_{i}.xlsx', write_workbook(workbook_values(master), uuid.uuid4().hex))
+             for i, master in enumerate(upload['masters'])]
+    body, content_type = encode_files(files)
+    request = urllib.request.Request(f'{args.url}/upload', data=body, headers={'Content-Type': content_type})
+
+    try:
+        with clients.opener.open(request, timeout=args.timeout) as response:
+            response.read()
+            return response.status == 200
+    except OSError: # error status, refused connection or timeout
+        return False
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('capture_dir')
+    parser.add_argument('--mode', choices=['pipeline', 'http'], default='pipeline')
+    parser.add_argument('--speed', type=float, default=0, help='replay speed relative to capture time, 0 for as fast as possible')
+    parser.add_argument('--zoom', type=float, default=2, help='render zoom in pipeline mode')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='app to replay against in http mode')
+    parser.add_argument('--password', default=os.getenv('FORM_CREATOR_PASSWORD'), help='login password in http mode')
+    parser.add_argument('--concurrency', type=int, default=8, help='uploads in flight at once in http mode')
+    parser.add_argument('--timeout', type=float, default=300, help='per request timeout in seconds')
+    parser.add_argument('--json', help='also write results to this file')
+    args = parser.parse_args()
+
+    uploads = [upload for upload in load_workload(args.capture_dir) if upload['masters']]
+    if not uploads:
+        sys.exit(f'No replayable uploads in {args.capture_dir}')
+
+    if args.json:
+        args.json = os.path.abspath(args.json)
+    if args.mode == 'pipeline':
+        os.chdir(APP_DIR) # main.py opens forms relative to the app directory
+
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    clients = threading.local() # one logged in session per client thread
+
+    def send(upload:dict):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            if args.mode == 'pipeline':
+                ok = replay_pipeline(upload, args.zoom)
+            else:
+                ok = replay_http(upload, args, clients)
+        except Exception as error:
+            print(f'Replay failed: {error!r}', file=sys.stderr)
+            ok = False
+        elapsed = time.perf_counter() - start
+
+        with lock:
+            latencies.append(elapsed)
+            errors += not ok
+
+    # fitz documents are not shared between threads, so the pipeline is replayed one upload at a time
+    concurrency = args.concurrency if args.mode == 'http' else 1
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for upload in uploads:
+            if args.speed:
+                delay = (upload['time'] - uploads[0]['time']) / args.speed - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay) # keep the captured spacing between uploads
+            pool.submit(send, upload)
+    duration = time.perf_counter() - start
+
+    files = sum(len(upload['masters']) for upload in uploads)
+    results = {
+        'mode': args.mode,
+        'uploads': len(uploads),
+        'files': files,
+        'seconds': duration,
+        'files_per_second': files / duration,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'error_rate': errors / len(latencies),
+    }
+
+    print(f"{results['uploads']} uploads, {files} files in {duration:.2f}s ({results['files_per_second']:.2f} files/s)")
+    print(f"upload latency p50 {results['p50']:.2f}s, p95 {results['p95']:.2f}s, p99 {results['p99']:.2f}s, errors {results['error_rate']:.1%}")
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,146 @@
+"""
+Builds synthetic assessment workbooks from template.xlsx with random but valid answers.
+
+Usage:
+    python tools/synthetic.py OUTPUT_DIR [--count 10] [--seed 0]
+"""
+
+import argparse
+from datetime import datetime
+from functools import lru_cache
+import io
+import os
+import random
+
+import openpyxl
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPLATE = os.path.join(ROOT, 'template.xlsx')
+FORMS = ['WHODAS', 'WHODASKIDS', 'CANS', 'LSP', 'LAWTON', 'BBS', 'LEFS', 'FRAT', 'HONOS', 'HONOSCA', 'CASP']
+
+# highest option for each LAWTON question, the rest go up to 4
+LAWTON_MAX = {'D': 5, 'E': 3, 'F': 5, 'G': 3, 'H': 3}
+
+# optional text entries, left empty
+OPTIONAL = {'A_desc', 'B_desc', 'C_desc', 'D_desc', 'comment8', 'Other_desc'}
+
+# WHODAS section 5 part 2 questions, which may be left empty as a whole
+WHODAS_PART2 = {'WHODAS': {'D55', 'D56', 'D57', 'D58'}, 'WHODASKIDS': {55, 56, 57, 58, 59}}
+
+
+def random_value(form:str, key, rnd:random.Random):
+    """
+    Returns a random valid answer for question key of form.
+    """
+
+    if key in OPTIONAL:
+        return None
+    if form in ('WHODAS', 'WHODASKIDS'):
+        return rnd.randint(1, 5)
+    if form == 'CANS':
+        return rnd.choice('YN')
+    if form == 'LSP':
+        return rnd.randint(0, 3)
+    if form == 'LAWTON':
+        return rnd.randint(1, LAWTON_MAX.get(key, 4))
+    if form == 'FRAT':
+        if key == 'Recent Falls':
+            return rnd.choice([2, 4, 6, 8])
+        if key in ('Medications', 'Psychological', 'Cognitive Status'):
+            return rnd.randint(1, 4)
+        return rnd.choice('YN')
+    if form == 'HONOS' and isinstance(key, str): # question 8 specifications
+        return rnd.choice('YN')
+    return rnd.randint(0, 4) # BBS, LEFS, HONOS, HONOSCA and CASP
+
+
+def random_general(rnd:random.Random):
+    """
+    Returns random patient details for the GENERAL column.
+    """
+
+    return {
+        'patient_first_name': rnd.choice(['Alex', 'Sam', 'Jordan', 'Taylor', 'Casey']),
+        'patient_surname': rnd.choice(['Smith', 'Nguyen', 'Brown', 'Wilson', 'Patel']),
+        'gender': rnd.choice('MF'),
+        'assessor_name': rnd.choice(['Dr Lee', 'Dr Jones']),
+        'DOB': datetime(rnd.randint(1940, 2015), rnd.randint(1, 12), rnd.randint(1, 28)),
+        'date': datetime(2024, rnd.randint(1, 12), rnd.randint(1, 28)),
+    }
+
+
+def write_workbook(values:dict, identifier=None):
+    """
+    Writes a dictionary of form name to {question: answer} into a copy of the template and returns the workbook bytes.
+    Forms not in values are left blank so no assessment is generated for them. identifier, if given, is stored in the
+    document properties, so workbooks with the same answers still differ and are not served from the app's output cache.
+    """
+
+    workbook = openpyxl.load_workbook(TEMPLATE)
+    workbook.properties.identifier = identifier
+    sheet = workbook.active
+    header = [cell.value for cell in sheet[1]]
+
+    for form, answers in values.items():
+        key_col = header.index(form) + 1
+        value_col = header.index(f'{form} Values') + 1
+
+        for row in range(2, sheet.max_row + 1):
+            key = sheet.cell(row, key_col).value
+            if key in answers:
+                sheet.cell(row, value_col).value = answers[key]
+
+    stream = io.BytesIO()
+    workbook.save(stream)
+    return stream.getvalue()
+
+
+@lru_cache(maxsize=None)
+def template_keys():
+    """
+    Returns the question keys of each form in the template, in template order.
+    """
+
+    sheet = openpyxl.load_workbook(TEMPLATE).active
+    header = [cell.value for cell in sheet[1]]
+    keys = {}
+
+    for form in ['GENERAL'] + FORMS:
+        col = header.index(form) + 1
+        keys[form] = [sheet.cell(row, col).value for row in range(2, sheet.max_row + 1) if sheet.cell(row, col).value is not None]
+
+    return keys
+
+
+def make_workbook(seed:int, forms=None, skip_part2=0.3):
+    """
+    Returns the bytes of a workbook with random answers for forms (all forms by default).
+    skip_part2 is the chance of leaving WHODAS section 5 part 2 empty, which takes the cross-out path.
+    """
+
+    rnd = random.Random(seed)
+    keys = template_keys()
+    values = {'GENERAL': random_general(rnd)}
+
+    for form in forms or FORMS:
+        skip = form in WHODAS_PART2 and rnd.random() < skip_part2
+        values[form] = {}
+        for key in keys[form]:
+            if skip and key in WHODAS_PART2[form]:
+                continue
+            values[form][key] = random_value(form, key, rnd)
+
+    return write_workbook(values)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('output_dir')
+    parser.add_argument('--count', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for i in range(args.count):
+        with open(os.path.join(args.output_dir, f'synthetic_{args.seed + i}.xlsx'), 'wb') as file:
+            file.write(make_workbook(args.seed + i))